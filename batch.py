@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import json
+import os
+from evaluate import AIEvaluator
+from files import TextProcessor
+
+
+def plan_items(model, dataset, settings_for_item):
+    """
+    为数据集中每个项目创建评估器并枚举全部评估单元
+    返回 ({项目: (评估器, 文件路径, 章节, {单元ID: 单元})}, {custom_id: (项目, 单元ID, 请求body)})
+    custom_id 由项目、单元ID和请求体的哈希组成：输入不变时跨运行保持稳定，文档修改后自动失效
+    """
+    items = {}
+    requests = {}
+    for item_key, item_data in dataset.items():
+        evaluator = AIEvaluator(model, item_key=item_key, **settings_for_item(item_data))
+        sections = TextProcessor(item_data['file_path']).process()
+        # 与本地运行一样先拆分超长段落，单元ID与检查点和增量评估一致
+        for section in sections:
+            evaluator.fit_section(section)
+        units = dict(evaluator.iter_units(sections))
+        items[item_key] = (evaluator, item_data['file_path'], sections, units)
+        for unit_id, unit in units.items():
+            prompt, schema = evaluator.unit_prompt(unit)
+            if prompt is None:
+                continue
+            body = model.batch_body(prompt, schema)
+            digest = hashlib.sha1(json.dumps(body, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+            requests[f"{item_key}/{unit_id}/{digest}"] = (item_key, unit_id, body)
+    return items, requests
+
+
+class BatchState:
+    """
+    批量运行的本地状态，保存在 state_dir 下，进程中断后重新运行即可继续：
+    - state.json：已提交的批次（ID、状态、是否已下载结果）
+    - results.jsonl：已取回的成功结果，custom_id -> 模型输出和 usage
+    失败的请求不写入 results.jsonl，下一轮重新提交
+    """
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        os.makedirs(state_dir, exist_ok=True)
+        self.state_path = os.path.join(state_dir, "state.json")
+        self.results_path = os.path.join(state_dir, "results.jsonl")
+        self.batches = []
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.batches = json.load(f)["batches"]
+        self.results = {}
+        if os.path.exists(self.results_path):
+            with open(self.results_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.results[entry["custom_id"]] = entry
+
+    def save(self):
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"batches": self.batches}, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.state_path)
+
+    def add_results(self, entries):
+        with open(self.results_path, 'a', encoding='utf-8') as f:
+            for entry in entries:
+                self.results[entry["custom_id"]] = entry
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def clear(self):
+        """全部结果写入 evaluation_results 后删除状态和批次的输入、输出文件"""
+        for name in os.listdir(self.state_dir):
+            if name in ("state.json", "results.jsonl") or (name.startswith(("input_", "output_")) and name.endswith(".jsonl")):
+                os.remove(os.path.join(self.state_dir, name))
+
+
+def parse_output_file(path):
+    """解析批次结果文件，返回成功的结果列表"""
+    succeeded = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            response = entry.get('response') or {}
+            body = response.get('body') or {}
+            if entry.get('error') or response.get('status_code') != 200 or not body.get('choices'):
+                continue
+            succeeded.append({
+                "custom_id": entry['custom_id'],
+                "content": body['choices'][0]['message']['content'],
+                "usage": body.get('usage') or {}
+            })
+    return succeeded
+
+
+async def wait_for_batch(client, state, batch, poll_interval):
+    """轮询批次直到终止状态，下载已完成部分的结果（过期或取消的批次也可能有部分结果）"""
+    while True:
+        info = await client.retrieve(batch['id'])
+        if info['status'] != batch.get('status'):
+            counts = info.get('request_counts') or {}
+            print(f"批次 {batch['id']}: {info['status']}（完成 {counts.get('completed', 0)}/{counts.get('total', batch['requests'])}，"
+                  f"失败 {counts.get('failed', 0)}）")
+            batch['status'] = info['status']
+            state.save()
+        if info['status'] in client.TERMINAL_STATUSES:
+            break
+        await asyncio.sleep(poll_interval)
+    if info.get('output_file_id'):
+        output_path = os.path.join(state.state_dir, f"output_{batch['id']}.jsonl")
+        await client.download(info['output_file_id'], output_path)
+        succeeded = parse_output_file(output_path)
+        state.add_results(succeeded)
+        print(f"批次 {batch['id']}: 取回 {len(succeeded)}/{batch['requests']} 个结果")
+    batch['downloaded'] = True
+    state.save()
+
+
+async def run_batches(client, requests, state, poll_interval=30, completion_window="24h", max_rounds=3):
+    """
+    提交尚未取得结果的请求并等待批次完成；中断后重新运行会先继续等待未下载的批次
+    失败或未完成的请求在下一轮重新提交，最多提交 max_rounds 个批次
+    """
+    for batch in state.batches:
+        if not batch.get('downloaded'):
+            await wait_for_batch(client, state, batch, poll_interval)
+    while True:
+        pending = [custom_id for custom_id in requests if custom_id not in state.results]
+        if not pending:
+            break
+        if len(state.batches) >= max_rounds:
+            print(f"已提交 {len(state.batches)} 个批次，仍有 {len(pending)} 个请求没有结果，按评估失败处理")
+            break
+        input_path = os.path.join(state.state_dir, f"input_{len(state.batches) + 1}.jsonl")
+        with open(input_path, 'w', encoding='utf-8') as f:
+            for custom_id in pending:
+                f.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions",
+                                    "body": requests[custom_id][2]}, ensure_ascii=False) + "\n")
+        input_file_id = await client.upload(input_path)
+        info = await client.create(input_file_id, completion_window=completion_window)
+        batch = {"id": info['id'], "input_file_id": input_file_id, "requests": len(pending), "status": info.get('status')}
+        state.batches.append(batch)
+        state.save()
+        print(f"已提交批次 {batch['id']}：{len(pending)} 个请求")
+        await wait_for_batch(client, state, batch, poll_interval)
+
+
+async def assemble_items(items, requests, state, model=None):
+    """把取回的模型输出解析为各单元的结果并写回章节评分，保存为常规的 evaluation_results/*.json"""
+    contents = {}
+    for custom_id, (item_key, unit_id, _) in requests.items():
+        entry = state.results.get(custom_id)
+        if entry is not None:
+            contents[(item_key, unit_id)] = entry['content']
+            if model is not None:
+                model._record_usage(entry.get('usage') or {})
+    saved = []
+    for item_key, (evaluator, file_path, sections, units) in items.items():
+        unit_ids = list(units)
+        results = await asyncio.gather(*(evaluator.unit_result(units[unit_id], contents.get((item_key, unit_id)))
+                                         for unit_id in unit_ids))
+        sections = evaluator.assemble(sections, dict(zip(unit_ids, results)))
+        # 批量模式不写检查点日志，保留本地运行中断后留下的日志
+        saved.append((item_key, evaluator.save_results(sections, file_path, clear_checkpoint=False)))
+    return saved
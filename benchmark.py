@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from mock_server import add_server_arguments, server_from_args
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块，不统计内存峰值
+    resource = None
+
+# 合成文档使用的句子素材
+SENTENCES = [
+    "大语言模型在多智能体协作中承担规划和推理的角色",
+    "知识图谱为决策过程提供结构化的领域知识",
+    "实验结果表明该方法在复杂任务上显著优于基线",
+    "系统通过检索增强降低了生成内容中的事实性错误",
+    "各智能体之间的通信开销随规模增长而迅速上升",
+    "我们进一步分析了不同参数设置对性能的影响",
+    "该框架支持在运行时动态调整任务分配策略",
+    "评估指标包括准确率、响应时间和资源消耗",
+    "在医疗和金融等高风险领域需要更严格的验证",
+    "未来的工作将探索更高效的知识更新机制"
+]
+
+CHINESE_NUMERALS = "一二三四五六七八九"
+
+
+def chinese_numeral(n):
+    """1-99 的中文数字，用于生成一级标题"""
+    tens, ones = divmod(n, 10)
+    text = ""
+    if tens:
+        text = ("" if tens == 1 else CHINESE_NUMERALS[tens - 1]) + "十"
+    if ones:
+        text += CHINESE_NUMERALS[ones - 1]
+    return text
+
+
+def write_synthetic_document(path, paragraphs, seed=0):
+    """
+    生成包含三级标题的合成文档，共 paragraphs 个正文段落
+    一级标题最多20个，其正文之后交替出现带正文的二级标题和三级标题
+    """
+    rng = random.Random(seed)
+    main_count = min(20, max(1, paragraphs // 10))
+    per_main = [paragraphs // main_count + (1 if i < paragraphs % main_count else 0) for i in range(main_count)]
+    subtitle = 0
+
+    def paragraph():
+        return "，".join(rng.choice(SENTENCES) for _ in range(rng.randint(2, 6))) + "。"
+
+    lines = []
+    for index, count in enumerate(per_main, 1):
+        lines.append(f"{chinese_numeral(index)}、第{index}部分")
+        # 按段落评分只针对一级标题下的正文，约一半段落放在这里，其余分给下级标题
+        body = (count + 1) // 2
+        lines.extend(line for _ in range(body) for line in (paragraph(), ""))
+        count -= body
+        while count > 0:
+            subtitle += 1
+            lines.append(f"{subtitle} 小节{subtitle}")
+            body = min(count, 2)
+            lines.extend(line for _ in range(body) for line in (paragraph(), ""))
+            count -= body
+            if count > 0:
+                lines.append(f"{subtitle}.1 细节{subtitle}")
+                body = min(count, 2)
+                lines.extend(line for _ in range(body) for line in (paragraph(), ""))
+                count -= body
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以KB为单位，macOS 以字节为单位
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def count_failed_scores(sections):
+    """统计评分为None的段落评分和段落对连贯性评分（调用失败或无法解析）"""
+    failed = 0
+    for section in sections:
+        for summary in section['scores'].values():
+            items = summary.get('paragraph_scores', []) + summary.get('coherence_scores', [])
+            failed += sum(1 for item in items if item.get('score') is None)
+    return failed
+
+
+def create_model(args, base_url):
+    from model.concurrency import AdaptiveConcurrencyController
+    from model.retry import RetryPolicy
+    options = {
+        "stream": args.stream,
+        "request_timeout": args.request_timeout,
+        "retry_policy": RetryPolicy(max_attempts=args.max_attempts, base_delay=args.retry_base_delay),
+        "concurrency": AdaptiveConcurrencyController(initial=args.concurrency, max_limit=max(args.concurrency, 64))
+    }
+    if args.provider == "openai":
+        from model.openai_model import OpenAIModel
+        return OpenAIModel("benchmark", base_url=base_url, rpm=args.rpm, tpm=args.tpm, **options)
+    from model.siliconflow_model import SiliconFlowModel
+    return SiliconFlowModel("benchmark", base_url=f"{base_url}/chat/completions", rpm=args.rpm, tpm=args.tpm, **options)
+
+
+async def run_case(args):
+    """在当前进程中评估一篇合成文档，返回本次运行的指标"""
+    from evaluate import AIEvaluator
+    from files import TextProcessor
+
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as workdir:
+        document = os.path.join(workdir, f"synthetic_{args.case}.txt")
+        write_synthetic_document(document, args.case, args.seed or 0)
+        model = create_model(args, args.url)
+        evaluator = AIEvaluator(model, "多智能体决策", "知识图谱增强的大语言模型多智能体决策方案", "专业、客观",
+                                max_concurrency=args.max_concurrency, combined_criteria=args.combined,
+                                checkpoint_file=os.path.join(workdir, "checkpoint.jsonl"), item_key=f"synthetic-{args.case}")
+
+        # 记录每次模型调用（含重试和排队）的耗时
+        latencies = []
+        get_response = model.get_response
+
+        async def timed_get_response(*call_args, **kwargs):
+            start = time.monotonic()
+            try:
+                return await get_response(*call_args, **kwargs)
+            finally:
+                latencies.append(time.monotonic() - start)
+
+        model.get_response = timed_get_response
+        start = time.monotonic()
+        try:
+            sections = await evaluator.evaluate_document(TextProcessor(document).iter_sections())
+        finally:
+            elapsed = time.monotonic() - start
+            await model.aclose()
+            evaluator.clear_checkpoint()
+
+    failed = count_failed_scores(sections)
+    usage = model.usage_stats()
+    return {
+        "paragraphs": args.case,
+        "sections": len(sections),
+        "calls": len(latencies),
+        "seconds": round(elapsed, 3),
+        "calls_per_second": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "paragraphs_per_second": round(args.case / elapsed, 2) if elapsed else None,
+        "latency_p50": round(percentile(latencies, 0.5), 4) if latencies else None,
+        "latency_p99": round(percentile(latencies, 0.99), 4) if latencies else None,
+        "prompt_tokens": usage["prompt_tokens"],
+        "completion_tokens": usage["completion_tokens"],
+        "total_tokens": usage["prompt_tokens"] + usage["completion_tokens"],
+        "failed_scores": failed,
+        "retries": model.retry_policy.stats()["retries"],
+        "parse": evaluator.parser.stats_summary(),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def client_arguments(args):
+    """传给子进程的客户端参数"""
+    values = ["--provider", args.provider, "--max-concurrency", str(args.max_concurrency),
+              "--concurrency", str(args.concurrency), "--rpm", str(args.rpm), "--tpm", str(args.tpm),
+              "--max-attempts", str(args.max_attempts), "--retry-base-delay", str(args.retry_base_delay),
+              "--request-timeout", str(args.request_timeout)]
+    if args.seed is not None:
+        values += ["--seed", str(args.seed)]
+    if args.stream:
+        values.append("--stream")
+    if args.combined:
+        values.append("--combined")
+    return values
+
+
+async def run_benchmark(args):
+    """
+    启动模拟服务，每种文档规模在独立的子进程中评估，保证内存峰值互不影响
+    结果写入 benchmarks/ 下的JSON文件，指定 --baseline 时与之前的结果对比
+    """
+    server = server_from_args(args)
+    base_url = await server.start(port=args.port)
+    results = []
+    try:
+        for paragraphs in args.paragraphs:
+            before = dict(server.stats)
+            with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+                output = f.name
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.abspath(__file__), "--case", str(paragraphs), "--url", base_url,
+                "--case-output", output, *client_arguments(args), stdout=asyncio.subprocess.DEVNULL
+            )
+            if await process.wait() != 0:
+                print(f"{paragraphs} 个段落的基准测试失败，退出码 {process.returncode}")
+                continue
+            with open(output, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            os.remove(output)
+            # 流式模式下客户端读到完整结果就断开，收不到末尾的 usage，令牌总数以服务端统计为准
+            result["server"] = {key: server.stats[key] - before[key] for key in server.stats}
+            results.append(result)
+            print_result(result)
+    finally:
+        await server.stop()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(args.output_dir, f"benchmark_{timestamp}.json")
+    settings = {key: value for key, value in vars(args).items() if key not in ("case", "url", "case_output", "baseline", "output_dir")}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"settings": settings, "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"基准测试结果已保存到: {path}")
+    if args.baseline:
+        compare(args.baseline, results)
+
+
+def print_result(result):
+    print(f"段落 {result['paragraphs']:>5} | 调用 {result['calls']:>6} | 耗时 {result['seconds']:>8.2f}s | "
+          f"吞吐 {result['calls_per_second']:>7.2f} 次/s | p50 {result['latency_p50']}s | p99 {result['latency_p99']}s | "
+          f"令牌 {result['server']['prompt_tokens'] + result['server']['completion_tokens']} | 失败评分 {result['failed_scores']} | 内存峰值 {result['peak_rss_mb']}MB")
+
+
+def compare(baseline_path, results):
+    """按文档规模对比吞吐量、p99延迟和内存峰值，比值大于1表示本次更大"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {result['paragraphs']: result for result in json.load(f)['results']}
+    print(f"与基准 {baseline_path} 对比：")
+    for result in results:
+        previous = baseline.get(result['paragraphs'])
+        if previous is None:
+            continue
+        ratios = []
+        for key in ("calls_per_second", "latency_p99", "peak_rss_mb"):
+            if result.get(key) and previous.get(key):
+                ratios.append(f"{key} x{result[key] / previous[key]:.2f}")
+        print(f"段落 {result['paragraphs']:>5} | " + " | ".join(ratios))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="在本地模拟服务上对评估流程进行端到端基准测试")
+    parser.add_argument('--paragraphs', type=int, nargs='+', default=[10, 100, 500, 2000], help="合成文档的段落数，每个取值运行一次")
+    parser.add_argument('--provider', choices=["siliconflow", "openai"], default="siliconflow", help="使用的模型客户端")
+    parser.add_argument('--max-concurrency', type=int, default=10, help="评估器的并发上限")
+    parser.add_argument('--concurrency', type=int, default=8, help="自适应并发控制器的初始窗口")
+    parser.add_argument('--rpm', type=int, default=1000000, help="模型客户端限流的每分钟请求数")
+    parser.add_argument('--tpm', type=int, default=1000000000, help="模型客户端限流的每分钟令牌数")
+    parser.add_argument('--max-attempts', type=int, default=5, help="每次调用的最大尝试次数")
+    parser.add_argument('--retry-base-delay', type=float, default=0.1, help="重试退避的基础延迟（秒）")
+    parser.add_argument('--request-timeout', type=float, default=30, help="请求超时（秒）")
+    parser.add_argument('--stream', action='store_true', help="使用流式输出")
+    parser.add_argument('--combined', action='store_true', help="合并评估模式")
+    parser.add_argument('--port', type=int, default=18000, help="模拟服务端口")
+    parser.add_argument('--output-dir', default="benchmarks", help="结果文件目录")
+    parser.add_argument('--baseline', help="之前的结果文件，用于对比")
+    add_server_arguments(parser)
+    # 内部参数：在子进程中运行单个规模
+    parser.add_argument('--case', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    parser.add_argument('--case-output', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if sys.platform.startswith('win'):
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    if args.case is not None:
+        result = asyncio.run(run_case(args))
+        with open(args.case_output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False)
+    else:
+        asyncio.run(run_benchmark(args))
@@ -1,5 +1,6 @@
 import json
 import os
+import time
 
 class CheckpointManager:
     @staticmethod
@@ -29,3 +30,83 @@ class CheckpointManager:
         if os.path.exists(filename):
             os.remove(filename)
 
+
+
+class CheckpointJournal:
+    """
+    单个文档的追加写入式检查点日志（JSONL）
+    每完成一个评估单元追加一行 {"unit": 单元ID, "key": 输入内容指纹, "result": 结果}，
+    每次写入后立即刷新到操作系统，按批次调用 fsync 落盘；恢复时重放日志跳过已完成的单元
+    """
+
+    def __init__(self, filename, fsync_every=32, fsync_interval=1.0):
+        self.filename = filename
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def replay(self):
+        """
+        读取日志，返回 {单元ID: (输入内容指纹, 结果)}
+        进程中断时最后一行可能只写了一半，解析失败的行直接忽略
+        """
+        entries = {}
+        if not os.path.exists(self.filename):
+            return entries
+        # 半行可能截断在多字节字符中间，按替换字符读取后由JSON解析失败而忽略
+        with open(self.filename, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                entries[record['unit']] = (record.get('key'), record['result'])
+        return entries
+
+    def append(self, unit_id, key, result):
+        if self._file is None:
+            directory = os.path.dirname(self.filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            needs_newline = self._ends_with_partial_line()
+            self._file = open(self.filename, 'a', encoding='utf-8')
+            if needs_newline:
+                # 上次中断留下的半行单独成行，新记录不会与它拼在一起而在重放时一并丢失
+                self._file.write("\n")
+        self._file.write(json.dumps({"unit": unit_id, "key": key, "result": result}, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self._pending += 1
+        if self._pending >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def _ends_with_partial_line(self):
+        """日志文件非空且不以换行结尾"""
+        try:
+            with open(self.filename, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return False
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) != b"\n"
+        except FileNotFoundError:
+            return False
+
+    def sync(self):
+        if self._file is not None and self._pending:
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def clear(self):
+        """评估完成后删除日志文件"""
+        self.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
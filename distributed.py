@@ -0,0 +1,91 @@
+import asyncio
+from evaluate import AIEvaluator
+from files import TextProcessor
+from metrics import metric_labels
+
+
+def submit_items(store, dataset, settings_for_item, model=None):
+    """
+    把数据集中每个项目的全部评估单元写入任务库
+    settings_for_item(item_data) 返回创建 AIEvaluator 所需的参数（topic、topic_description 等）
+    model 提供上下文窗口，超长段落与本地运行一样先拆分再生成评估单元，提交时不调用模型
+    """
+    for item_key, item_data in dataset.items():
+        settings = settings_for_item(item_data)
+        sections = TextProcessor(item_data['file_path']).process()
+        evaluator = AIEvaluator(model, **settings)
+        for section in sections:
+            evaluator.fit_section(section)
+        units = list(evaluator.iter_units(sections))
+        store.add_item(item_key, item_data['file_path'], settings, sections, units)
+        print(f"已提交 {item_key}：{len(units)} 个评估单元")
+
+
+async def run_worker(store, model, worker, checkpoint_path_for, max_concurrency=10, lease_seconds=120, poll_interval=5):
+    """
+    工作进程：持续领取任务并写回结果，直到任务库中没有待执行或被租用的任务
+    执行期间定期续租，进程崩溃后其租约过期，任务会被其他工作进程重新领取
+    checkpoint_path_for(file_path) 返回文档的检查点路径，与本地运行和 merge_results 使用同一路径
+    """
+    evaluators = {}
+    running = {}
+
+    def evaluator_for(item_key):
+        if item_key not in evaluators:
+            item = store.get_item(item_key)
+            evaluators[item_key] = AIEvaluator(model, max_concurrency=max_concurrency,
+                                               checkpoint_file=checkpoint_path_for(item['file_path']), **item['settings'])
+        return evaluators[item_key]
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            store.renew(worker, lease_seconds)
+
+    renewer = asyncio.create_task(heartbeat())
+    completed = 0
+    try:
+        while True:
+            free = max_concurrency - len(running)
+            if free > 0:
+                for item_key, unit_id, unit in store.claim(worker, lease_seconds, free):
+                    with metric_labels(item=item_key):
+                        task = asyncio.ensure_future(evaluator_for(item_key).run_unit(unit))
+                    running[task] = (item_key, unit_id)
+            if not running:
+                stats = store.stats()
+                if stats['pending'] == 0 and stats['leased'] == 0:
+                    break
+                # 其他工作进程持有租约，等待其完成或过期
+                await asyncio.sleep(poll_interval)
+                continue
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item_key, unit_id = running.pop(task)
+                result = task.result()
+                if AIEvaluator._is_complete(result):
+                    store.complete(item_key, unit_id, result)
+                else:
+                    # 评分为None的单元放回队列重试，超过最大尝试次数后按该结果完成
+                    store.fail(item_key, unit_id, result)
+                completed += 1
+    finally:
+        renewer.cancel()
+        for task in running:
+            task.cancel()
+    print(f"工作进程 {worker} 完成 {completed} 个评估单元")
+    for item_key, evaluator in evaluators.items():
+        print(f"解析统计：{item_key} {evaluator.parser.stats_summary()}")
+
+
+def merge_results(store, checkpoint_path_for):
+    """把全部单元已完成的项目合并为常规的 evaluation_results/*.json，返回 [(项目, 结果文件路径)]"""
+    merged = []
+    for item_key in store.finished_items():
+        item = store.get_item(item_key)
+        evaluator = AIEvaluator(None, checkpoint_file=checkpoint_path_for(item['file_path']), **item['settings'])
+        sections = evaluator.assemble(item['sections'], store.results(item_key))
+        merged.append((item_key, evaluator.save_results(sections, item['file_path'])))
+        store.mark_merged(item_key)
+    return merged
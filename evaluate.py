@@ -1,18 +1,32 @@
 from model.siliconflow_model import SiliconFlowModel
-from typing import List, Dict, Any
+from model.tokens import TokenCounter
+from typing import List, Dict, Any, Iterable, Optional
 import asyncio
+import inspect
 import sys
 import json
 import os
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
 from tqdm.asyncio import tqdm as tqdm_asyncio
 from tqdm import tqdm
 from log import Logger
-from checkpoint import CheckpointManager
-from myparser import ResponseParser
+from checkpoint import CheckpointJournal
+from myparser import ResponseParser, EVALUATION_SCHEMA, multi_score_schema
+from scheduler import TaskGraphScheduler
+from incremental import PreviousResults, paragraph_hash
+from metrics import metrics, metric_labels
+from tracing import tracer, trace_attrs
 
 class AIEvaluator:
-    def __init__(self, model, topic, topic_description, expected_style):
+    # 按相邻段落对评估的标准，其余标准按段落评估
+    COHERENCE_CRITERION = "逻辑连贯性和结构"
+    # 计算段落长度上限时为模型输出预留的令牌数
+    OUTPUT_TOKEN_RESERVE = 2048
+
+    def __init__(self, model, topic, topic_description, expected_style, max_concurrency=10, combined_criteria=False,
+                 checkpoint_file="checkpoints/evaluation_checkpoint.jsonl", work_queue=None, item_key=None):
         self.model = model
         self.criteria = [
             "内容准确性和相关性",
@@ -61,16 +75,46 @@ class AIEvaluator:
         self.topic = topic
         self.topic_description = topic_description
         self.expected_style = expected_style
-        self.checkpoint_file = "evaluation_checkpoint.json"
+        # 每个文档使用独立的检查点日志，并发评估的文档互不覆盖
+        self.checkpoint_file = checkpoint_file
         self.logger = Logger.setup_logging()
         self.parser = ResponseParser(self.logger, self.model)
+        # 按段落评估的标准：评分标准 -> 提示词构造函数
+        self.paragraph_criteria = {
+            "内容准确性和相关性": self._create_accuracy_relevance_prompt,
+            "语言流畅度和表达": self._create_fluency_prompt,
+            "风格和语调一致性": self._create_style_consistency_prompt,
+            "完整性和深度": self._create_completeness_depth_prompt
+        }
+        self.score_labels = {
+            "内容准确性和相关性": "段落评分",
+            "语言流畅度和表达": "段落流畅度评分",
+            "风格和语调一致性": "段落风格一致性评分",
+            "完整性和深度": "段落完整性和深度评分"
+        }
+        # 同时进行中的模型调用数上限
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.tokens = TokenCounter.shared()
+        self._max_paragraph_tokens = None
+        # 跨文档共享的工作队列：提供时模型调用在全局预算内按优先级和公平份额调度
+        self.work_queue = work_queue
+        self.item_key = item_key
+        # 合并评估模式：每个段落只发送一次包含全部评分标准的提示词
+        self.combined_criteria = combined_criteria
+        # 增量评估时上一次评估结果的索引
+        self.previous_results = None
+        self.reused_units = 0
+        # 从检查点日志恢复的评估单元数
+        self.resumed_units = 0
+        self.evaluated_units = 0
 
     async def evaluate_section(self, section: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
         scores = {}
         for criterion in self.criteria:
             if criterion == "内容准确性和相关性":
                 scores[criterion] = await self._evaluate_accuracy_relevance(section)
-            elif criterion == "逻连贯性和结构":
+            elif criterion == "逻辑连贯性和结构":
                 scores[criterion] = await self._evaluate_coherence(section)
             elif criterion == "语言流畅度和表达":
                 scores[criterion] = await self._evaluate_fluency(section)
@@ -86,31 +130,15 @@ class AIEvaluator:
         return scores
 
     async def _evaluate_accuracy_relevance(self, section: Dict[str, Any]) -> Dict[str, Any]:
-        paragraph_scores = []
-        async for paragraph in tqdm_asyncio(section['paragraphs'], desc="评估准确性和相关性", leave=False):
-            prompt = self._create_accuracy_relevance_prompt(paragraph)
-            response = await self._get_model_response(prompt)
-            score, explanation = await self._parse_model_response(response)  # 在这里添加 await
-            paragraph_scores.append({"score": score, "explanation": explanation})
-        
-        overall_score = round(sum(item['score'] for item in paragraph_scores) / len(paragraph_scores), 1)
-        overall_explanation = f"段落评分: {', '.join([str(item['score']) for item in paragraph_scores])}。整体评分为各段落评分的平均值。"
-        
-        return {
-            "overall_score": overall_score,
-            "overall_explanation": overall_explanation,
-            "paragraph_scores": paragraph_scores
-        }
+        paragraph_scores = await self._evaluate_paragraphs(section['paragraphs'], self._create_accuracy_relevance_prompt, "评估准确性和相关性")
+        return self._summarize_paragraph_scores("内容准确性和相关性", paragraph_scores)
 
     def _create_accuracy_relevance_prompt(self, paragraph: str) -> str:
-        prompt = f"""请评估以下段落的"内容准确性和相关性"，考虑到以下主题和描述：
+        prompt = f"""请评估文末段落的"内容准确性和相关性"，考虑到以下主题和描述：
 
 主题：{self.topic}
 主题描述：{self.topic_description}
 
-段落内容：
-{paragraph}
-
 评分标准：
 1分（很差）：{self.grade_descriptions["内容准确性和相关性"][1]}
 2分（较差）：{self.grade_descriptions["内容准确性和相关性"][2]}
@@ -121,60 +149,109 @@ class AIEvaluator:
 请给出评分（1-5）并简要解释原因。
 
 ***输出格式***
-输出格式：{{"reasoning":{{"解释一步一步评估的过程"}},"result":{{"score": 评分, "explanation": "简要解释"}}}}
+输出格式：{{"reasoning": "解释一步一步评估的过程", "result":{{"score": 评分, "explanation": "简要解释"}}}}
 
 请确保您的回答严格遵循这个格式。
+
+段落内容：
+{paragraph}
 """
         return prompt
 
-    async def _get_model_response(self, prompt: str) -> str:
-        response = await self.model.get_response(prompt)
+    async def _get_model_response(self, prompt: str, response_schema: Dict[str, Any] = EVALUATION_SCHEMA) -> str:
+        response = await self.model.get_response(prompt, response_schema=response_schema)
         Logger.log_model_io(self.logger, prompt, response)
         return response
 
+    @asynccontextmanager
+    async def _call_slot(self):
+        """一次模型调用占用的并发名额，记录排队等待时间"""
+        start = time.monotonic()
+        if self.work_queue is not None:
+            slot, stage = self.work_queue.slot(self.item_key), "work_queue"
+        else:
+            slot, stage = self.semaphore, "semaphore"
+        async with slot:
+            metrics.observe("queue_wait_seconds", time.monotonic() - start, stage=stage)
+            tracer.record("queue_wait", start)
+            yield
+
+    async def _evaluate_prompt(self, prompt: str) -> Dict[str, Any]:
+        """
+        在并发上限内完成一次模型调用和解析
+        单次调用失败不会影响其他段落，失败的评分记为None
+        """
+        async with self._call_slot():
+            try:
+                response = await self._get_model_response(prompt)
+                with tracer.span("parse"):
+                    score, explanation = await self._parse_model_response(response)
+            except Exception as e:
+                Logger.log_warning(self.logger, f"评估调用失败: {type(e).__name__}: {str(e)}")
+                return {"score": None, "explanation": f"评估失败: {type(e).__name__}"}
+        return {"score": score, "explanation": explanation}
+
+    async def _evaluate_paragraphs(self, paragraphs: List[str], create_prompt, desc: str) -> List[Dict[str, Any]]:
+        """
+        并发评估段落列表，返回的评分顺序与段落顺序一致
+        """
+        pbar = tqdm_asyncio(total=len(paragraphs), desc=desc, leave=False)
+
+        async def evaluate_paragraph(paragraph):
+            result = await self._evaluate_prompt(create_prompt(paragraph))
+            pbar.update(1)
+            return result
+
+        paragraph_scores = await asyncio.gather(*(evaluate_paragraph(paragraph) for paragraph in paragraphs))
+        pbar.close()
+        return list(paragraph_scores)
+
+    @staticmethod
+    def _average_score(scores: List[Dict[str, Any]]):
+        """计算有效评分的平均值，忽略失败（None）的评分"""
+        valid_scores = [item['score'] for item in scores if item['score'] is not None]
+        if not valid_scores:
+            return None
+        return round(sum(valid_scores) / len(valid_scores), 1)
+
     async def _evaluate_coherence(self, content: Dict[str, Any]) -> Dict[str, Any]:
-        coherence_scores = []
-        
-        # 计算总评估次数
-        total_evaluations = len(content['paragraphs']) - 1
-        if 'subsections' in content:
-            total_evaluations += sum(len(subsection['paragraphs']) - 1 for subsection in content['subsections'])
+        pairs = self._coherence_pairs(content)
         
         # 创建进度条
-        pbar = tqdm_asyncio(total=total_evaluations, desc="评估连贯性")
+        pbar = tqdm_asyncio(total=len(pairs), desc="评估连贯性")
         
-        # 评估主要段落之间的连贯性
+        async def evaluate_pair(paragraph1, paragraph2, meta):
+            result = await self._evaluate_prompt(self._create_coherence_prompt(paragraph1, paragraph2))
+            pbar.update(1)
+            return {**meta, **result}
+        
+        # 并发评估，结果顺序与段落对顺序一致
+        coherence_scores = list(await asyncio.gather(*(evaluate_pair(*pair) for pair in pairs)))
+        
+        # 关闭进度条
+        pbar.close()
+        
+        return self._summarize_coherence_scores(coherence_scores)
+
+    @staticmethod
+    def _coherence_pairs(content: Dict[str, Any]) -> List[tuple]:
+        """收集需要评估的相邻段落对：(段落1, 段落2, 结果元信息)"""
+        pairs = []
+        
+        # 主要段落之间的连贯性
         main_paragraphs = content['paragraphs']
         for i in range(len(main_paragraphs) - 1):
-            prompt = self._create_coherence_prompt(main_paragraphs[i], main_paragraphs[i+1])
-            response = await self._get_model_response(prompt)
-            score, explanation = await self._parse_model_response(response)
-            coherence_scores.append({
-                "type": "main",
-                "score": score,
-                "explanation": explanation
-            })
-            pbar.update(1)
+            pairs.append((main_paragraphs[i], main_paragraphs[i+1], {"type": "main"}))
         
-        # 评估子章节内部的连贯性
+        # 子章节内部的连贯性
         if 'subsections' in content:
             for subsection in content['subsections']:
                 sub_paragraphs = subsection['paragraphs']
                 for i in range(len(sub_paragraphs) - 1):
-                    prompt = self._create_coherence_prompt(sub_paragraphs[i], sub_paragraphs[i+1])
-                    response = await self._get_model_response(prompt)
-                    score, explanation = await self._parse_model_response(response)
-                    coherence_scores.append({
-                        "type": "subsection",
-                        "title": subsection['title'],
-                        "score": score,
-                        "explanation": explanation
-                    })
-                    pbar.update(1)
-        
-        # 关闭进度条
-        pbar.close()
-        
+                    pairs.append((sub_paragraphs[i], sub_paragraphs[i+1], {"type": "subsection", "title": subsection['title']}))
+        return pairs
+
+    def _summarize_coherence_scores(self, coherence_scores: List[Dict[str, Any]]) -> Dict[str, Any]:
         if not coherence_scores:
             return {
                 "overall_score": None,
@@ -182,7 +259,7 @@ class AIEvaluator:
                 "coherence_scores": []
             }
         
-        overall_score = round(sum(item['score'] for item in coherence_scores) / len(coherence_scores), 1)
+        overall_score = self._average_score(coherence_scores)
         overall_explanation = f"总共评估了 {len(coherence_scores)} 对段落的连贯性。整体评分为各评分的平均值。"
         
         return {
@@ -191,14 +268,18 @@ class AIEvaluator:
             "coherence_scores": coherence_scores
         }
 
-    def _create_coherence_prompt(self, paragraph1: str, paragraph2: str) -> str:
-        prompt = f"""请评估以下两个连续段落之间的"逻辑连贯性和结构"：
-
-段落1：
-{paragraph1}
+    def _summarize_paragraph_scores(self, criterion: str, paragraph_scores: List[Dict[str, Any]]) -> Dict[str, Any]:
+        overall_score = self._average_score(paragraph_scores)
+        overall_explanation = f"{self.score_labels[criterion]}: {', '.join([str(item['score']) for item in paragraph_scores])}。整体评分为各段落评分的平均值。"
+        
+        return {
+            "overall_score": overall_score,
+            "overall_explanation": overall_explanation,
+            "paragraph_scores": paragraph_scores
+        }
 
-段落2：
-{paragraph2}
+    def _create_coherence_prompt(self, paragraph1: str, paragraph2: str) -> str:
+        prompt = f"""请评估文末两个连续段落之间的"逻辑连贯性和结构"：
 
 评分标准：
 1分（很差）：{self.grade_descriptions["逻辑连贯性和结构"][1]}
@@ -210,34 +291,24 @@ class AIEvaluator:
 请特别注意段落之间的衔接是否自然，逻辑是否连贯。给出评分（1-5）并简要解释原因。
 
 ***输出格式***
-输出格式：{{"reasoning":{{"解释一步一步评估的过程"}},"result":{{"score": 评分, "explanation": "简要解释"}}}}
+输出格式：{{"reasoning": "解释一步一步评估的过程", "result":{{"score": 评分, "explanation": "简要解释"}}}}
 
 请确保您的回答严格遵循这个格式。
+
+段落1：
+{paragraph1}
+
+段落2：
+{paragraph2}
 """
         return prompt
 
     async def _evaluate_fluency(self, section: Dict[str, Any]) -> Dict[str, Any]:
-        paragraph_scores = []
-        async for paragraph in tqdm_asyncio(section['paragraphs'], desc="评估语言流畅度", leave=False):
-            prompt = self._create_fluency_prompt(paragraph)
-            response = await self._get_model_response(prompt)
-            score, explanation = await self._parse_model_response(response)
-            paragraph_scores.append({"score": score, "explanation": explanation})
-        
-        overall_score = round(sum(item['score'] for item in paragraph_scores) / len(paragraph_scores), 1)
-        overall_explanation = f"段落流畅度评分: {', '.join([str(item['score']) for item in paragraph_scores])}。整体评分为各段落评分的平均值。"
-        
-        return {
-            "overall_score": overall_score,
-            "overall_explanation": overall_explanation,
-            "paragraph_scores": paragraph_scores
-        }
+        paragraph_scores = await self._evaluate_paragraphs(section['paragraphs'], self._create_fluency_prompt, "评估语言流畅度")
+        return self._summarize_paragraph_scores("语言流畅度和表达", paragraph_scores)
 
     def _create_fluency_prompt(self, paragraph: str) -> str:
-        prompt = f"""请评估以下段落的"语言流畅度和表达"：
-
-段落内容：
-{paragraph}
+        prompt = f"""请评估文末段落的"语言流畅度和表达"：
 
 评分标准：
 1分（很差）：{self.grade_descriptions["语言流畅度和表达"][1]}
@@ -249,37 +320,24 @@ class AIEvaluator:
 请给出评分（1-5）并简要解释原因。
 
 ***输出格式***
-输出格式：{{"reasoning":{{"解释一步一步评估的过程"}},"result":{{"score": 评分, "explanation": "简要解释"}}}}
+输出格式：{{"reasoning": "解释一步一步评估的过程", "result":{{"score": 评分, "explanation": "简要解释"}}}}
 
 请确保您的回答严格遵循这个格式。
+
+段落内容：
+{paragraph}
 """
         return prompt
 
     async def _evaluate_style_consistency(self, section: Dict[str, Any]) -> Dict[str, Any]:
-        paragraph_scores = []
-        async for paragraph in tqdm_asyncio(section['paragraphs'], desc="评估风格一致性", leave=False):
-            prompt = self._create_style_consistency_prompt(paragraph)
-            response = await self._get_model_response(prompt)
-            score, explanation = await self._parse_model_response(response)
-            paragraph_scores.append({"score": score, "explanation": explanation})
-        
-        overall_score = round(sum(item['score'] for item in paragraph_scores) / len(paragraph_scores), 1)
-        overall_explanation = f"段落风格一致性评分: {', '.join([str(item['score']) for item in paragraph_scores])}。整体评分为各段落评分的平均值。"
-        
-        return {
-            "overall_score": overall_score,
-            "overall_explanation": overall_explanation,
-            "paragraph_scores": paragraph_scores
-        }
+        paragraph_scores = await self._evaluate_paragraphs(section['paragraphs'], self._create_style_consistency_prompt, "评估风格一致性")
+        return self._summarize_paragraph_scores("风格和语调一致性", paragraph_scores)
     
     def _create_style_consistency_prompt(self, paragraph: str) -> str:
-        prompt = f"""请评估以下段落的"风格和语调一致性"，考虑到预期的风格和语调：
+        prompt = f"""请评估文末段落的"风格和语调一致性"，考虑到预期的风格和语调：
 
 预期风格和语调：{self.expected_style}
 
-段落内容：
-{paragraph}
-
 评分标准：
 1分（很差）：{self.grade_descriptions["风格和语调一致性"][1]}
 2分（较差）：{self.grade_descriptions["风格和语调一致性"][2]}
@@ -290,38 +348,25 @@ class AIEvaluator:
 请给出评分（1-5）并简要解释原因，特别注意段落的风格和语调是否与预期一致。
 
 ***输出格式***
-输出格式：{{"reasoning":{{"解释一步一步评估的过程"}},"result":{{"score": 评分, "explanation": "简要解释"}}}}
+输出格式：{{"reasoning": "解释一步一步评估的过程", "result":{{"score": 评分, "explanation": "简要解释"}}}}
 
 请确保您的回答严格遵循这个格式。
+
+段落内容：
+{paragraph}
 """
         return prompt
 
     async def _evaluate_completeness_depth(self, section: Dict[str, Any]) -> Dict[str, Any]:
-        paragraph_scores = []
-        async for paragraph in tqdm_asyncio(section['paragraphs'], desc="评估完整性和深度", leave=False):
-            prompt = self._create_completeness_depth_prompt(paragraph)
-            response = await self._get_model_response(prompt)
-            score, explanation = await self._parse_model_response(response)  # 在这里添加 await
-            paragraph_scores.append({"score": score, "explanation": explanation})
-        
-        overall_score = round(sum(item['score'] for item in paragraph_scores) / len(paragraph_scores), 1)
-        overall_explanation = f"段落完整性和深度评分: {', '.join([str(item['score']) for item in paragraph_scores])}。整体评分为各段落评分的平均值。"
-        
-        return {
-            "overall_score": overall_score,
-            "overall_explanation": overall_explanation,
-            "paragraph_scores": paragraph_scores
-        }
+        paragraph_scores = await self._evaluate_paragraphs(section['paragraphs'], self._create_completeness_depth_prompt, "评估完整性和深度")
+        return self._summarize_paragraph_scores("完整性和深度", paragraph_scores)
 
     def _create_completeness_depth_prompt(self, paragraph: str) -> str:
-        prompt = f"""请评估以下段落的"完整性和深度"，考虑到以下主题和描述：
+        prompt = f"""请评估文末段落的"完整性和深度"，考虑到以下主题和描述：
 
 主题：{self.topic}
 主题描述：{self.topic_description}
 
-段落内容：
-{paragraph}
-
 评分标准：
 1分（很差）：{self.grade_descriptions["完整性和深度"][1]}
 2分（较差）：{self.grade_descriptions["完整性和深度"][2]}
@@ -337,65 +382,411 @@ class AIEvaluator:
 5. 段落的深度是否满足了预期的专业水平？
 
 ***输出格式***
-输出格式：{{"reasoning":{{"解释一步一步评估的过程"}},"result":{{"score": 评分, "explanation": "简要解释"}}}}
+输出格式：{{"reasoning": "解释一步一步评估的过程", "result":{{"score": 评分, "explanation": "简要解释"}}}}
 
 请确保您的回答严格遵循这个格式。
+
+段落内容：
+{paragraph}
+"""
+        return prompt
+
+    def _create_combined_prompt(self, paragraph: str) -> str:
+        """将四个按段落评估的标准合并到一个提示词中，一次调用得到全部评分"""
+        rubrics = ""
+        for criterion in self.paragraph_criteria:
+            rubrics += f"""
+【{criterion}】
+1分（很差）：{self.grade_descriptions[criterion][1]}
+2分（较差）：{self.grade_descriptions[criterion][2]}
+3分（一般）：{self.grade_descriptions[criterion][3]}
+4分（良好）：{self.grade_descriptions[criterion][4]}
+5分（优秀）：{self.grade_descriptions[criterion][5]}
+"""
+        result_format = ", ".join(f'"{criterion}":{{"score": 评分, "explanation": "简要解释"}}' for criterion in self.paragraph_criteria)
+        prompt = f"""请从以下{len(self.paragraph_criteria)}个维度分别评估文末的段落：{"、".join(f'"{criterion}"' for criterion in self.paragraph_criteria)}。
+
+主题：{self.topic}
+主题描述：{self.topic_description}
+预期风格和语调：{self.expected_style}
+
+各维度评分标准：
+{rubrics}
+评估"完整性和深度"时，请考虑段落是否涵盖了主题的重要方面、是否深入探讨了相关问题、是否提供了足够的细节和例子、是否考虑了不同视角，以及深度是否满足预期的专业水平。
+
+请为每个维度分别给出评分（1-5）并简要解释原因。
+
+***输出格式***
+输出格式：{{"reasoning": "解释一步一步评估的过程", "result":{{{result_format}}}}}
+
+请确保您的回答严格遵循这个格式。
+
+段落内容：
+{paragraph}
 """
         return prompt
 
-    async def evaluate_document(self, sections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        evaluated_sections = CheckpointManager.load_checkpoint(self.checkpoint_file)
-        start_index = len(evaluated_sections)
-        total_steps = len(sections) * len(self.criteria) + len(sections) - 1  # 章节评估 + 章节间连贯性评估
+    async def _evaluate_combined(self, paragraph: str) -> Dict[str, Dict[str, Any]]:
+        """
+        一次调用评估段落的全部按段落评估标准
+        未能解析出的标准回退为单独的评估调用
+        """
+        async with self._call_slot():
+            try:
+                response = await self._get_model_response(self._build_prompt(self._create_combined_prompt, paragraph), multi_score_schema(list(self.paragraph_criteria)))
+                with tracer.span("parse"):
+                    parsed = self.parser.parse_multi_score_response(response, list(self.paragraph_criteria))
+            except Exception as e:
+                Logger.log_warning(self.logger, f"合并评估调用失败: {type(e).__name__}: {str(e)}")
+                parsed = {}
+        
+        results = {criterion: {"score": score, "explanation": explanation} for criterion, (score, explanation) in parsed.items()}
+        missing = [criterion for criterion in self.paragraph_criteria if criterion not in results]
+        if missing:
+            Logger.log_warning(self.logger, f"合并评估缺少以下标准，改为单独评估: {', '.join(missing)}")
+            fallback = await asyncio.gather(*(self._evaluate_prompt(self._build_prompt(self.paragraph_criteria[criterion], paragraph)) for criterion in missing))
+            results.update(zip(missing, fallback))
+        return results
+
+    async def evaluate_document(self, sections: Iterable[Dict[str, Any]], previous_results: PreviousResults = None) -> List[Dict[str, Any]]:
+        """
+        评估整篇文档
+        sections 可以是列表，也可以是 TextProcessor.iter_sections() 这样的生成器：
+        每读到一个章节就加入任务图开始评估，无需等待整个文件解析完成
+        提供 previous_results 时进行增量评估：内容未变化的段落、段落对和章节对直接复用上次的评分
+        检查点日志中已完成且输入未变化的评估单元直接恢复，不再调用模型
+        """
+        self.previous_results = previous_results
+        self.reused_units = 0
+        self.resumed_units = 0
+        self.journal = CheckpointJournal(self.checkpoint_file)
+        self.journal_entries = self.journal.replay()
+        self.unit_keys = {}
         
-        with tqdm(total=total_steps, desc="评估进度", initial=start_index * len(self.criteria)) as pbar:
-            for i in tqdm(range(start_index, len(sections)), desc="评估节"):
-                section = sections[i]
-                scores = {}
-                for criterion in self.criteria:
-                    if criterion == "内容准确性和相关性":
-                        scores[criterion] = await self._evaluate_accuracy_relevance(section)
-                    elif criterion == "逻辑连贯性和结构":
-                        scores[criterion] = await self._evaluate_coherence(section)
-                    elif criterion == "语言流畅度和表达":
-                        scores[criterion] = await self._evaluate_fluency(section)
-                    elif criterion == "风格和语调一致性":
-                        scores[criterion] = await self._evaluate_style_consistency(section)
-                    elif criterion == "完整性和深度":
-                        scores[criterion] = await self._evaluate_completeness_depth(section)
+        # 整篇文档的所有评估单元构成一个任务图，章节边读取边加入
+        graph = TaskGraphScheduler(self.max_concurrency)
+        graph.open()
+        evaluated_sections = []
+        
+        with tqdm(total=0, desc="评估进度") as pbar:
+            concurrency = getattr(self.model, 'concurrency', None)
+            def on_unit_done(unit):
+                if unit.uses_capacity:
+                    result = graph.results[unit.unit_id]
+                    if self._is_complete(result):
+                        # 评估失败的单元不写入日志，恢复时重新评估
+                        with tracer.span("checkpoint_write", unit=unit.unit_id):
+                            self.journal.append(unit.unit_id, self.unit_keys.get(unit.unit_id), result)
                     pbar.update(1)
-                section['scores'] = scores
-                evaluated_sections.append(section)
-                CheckpointManager.save_checkpoint(evaluated_sections, self.checkpoint_file)
+                    if self.work_queue is not None:
+                        self.work_queue.unit_done(self.item_key)
+                    if concurrency is not None:
+                        # 显示自适应并发窗口和实际吞吐量
+                        pbar.set_postfix(window=concurrency.window, rps=round(concurrency.throughput(), 2))
             
-            # 评估相邻章节之间的连贯性
-            for i in range(start_index, len(evaluated_sections) - 1):
-                if evaluated_sections[i].get('parent_title') == evaluated_sections[i+1].get('parent_title'):
-                    coherence_prompt = self._create_section_coherence_prompt(evaluated_sections[i], evaluated_sections[i+1])
-                    response = await self._get_model_response(coherence_prompt)
-                    score, explanation = await self._parse_model_response(response)
-                    evaluated_sections[i]['section_coherence'] = {"score": score, "explanation": explanation}
-                else:
-                    evaluated_sections[i]['section_coherence'] = {
-                        "score": None,
-                        "explanation": "相邻章节属于不同的大标题，不评估连贯性。"
-                    }
-                pbar.update(1)
-                CheckpointManager.save_checkpoint(evaluated_sections, self.checkpoint_file)
+            # 本文档的所有模型调用都带上项目标签
+            with metric_labels(item=self.item_key), trace_attrs(document=self.item_key):
+                runner = asyncio.ensure_future(graph.run(on_unit_done))
+            iterator = iter(sections)
+            try:
+                while not runner.done():
+                    # 在线程中读取下一个章节，读取期间已加入的单元继续执行
+                    section = await asyncio.to_thread(next, iterator, None)
+                    if section is None:
+                        break
+                    await self._fit_section(section)
+                    index = len(evaluated_sections)
+                    evaluated_sections.append(section)
+                    added = graph.count()
+                    self._plan_section(graph, index, section)
+                    # 章节间连贯性只依赖原文，与章节评估同时进行
+                    if index > 0:
+                        self._add_unit(graph, f"section/{index - 1}", self._section_pair_unit(evaluated_sections[index - 1], section))
+                    added = graph.count() - added
+                    pbar.total += added
+                    pbar.refresh()
+                    if self.work_queue is not None:
+                        self.work_queue.add_units(self.item_key, added)
+                graph.close()
+                await runner
+            finally:
+                if not runner.done():
+                    runner.cancel()
+                self.journal.close()
+                if inspect.isgenerator(iterator):
+                    # 提前结束（调度出错或任务取消）时关闭章节生成器，释放其中打开的文件
+                    try:
+                        iterator.close()
+                    except ValueError:
+                        # 取消时读取线程可能仍在执行生成器，此时只能等它结束后由垃圾回收关闭
+                        pass
         
+        self.evaluated_units = graph.count()
+        if self.resumed_units:
+            print(f"从检查点恢复 {self.resumed_units} 个评估单元")
+        if previous_results is not None:
+            print(f"增量评估：复用 {self.reused_units} 个评估单元，重新评估 {self.evaluated_units} 个")
+        
+        for index in range(len(evaluated_sections) - 1):
+            evaluated_sections[index]['section_coherence'] = graph.results[f"section/{index}"]
         return evaluated_sections
 
-    def clear_checkpoint(self):
-        CheckpointManager.clear_checkpoint(self.checkpoint_file)
+    def max_paragraph_tokens(self):
+        """
+        单个段落允许的最大令牌数：上下文窗口扣除最长的提示词模板和输出预留后，
+        再除以2（段落对连贯性评估的提示词包含两个段落）
+        """
+        context_window = getattr(self.model, 'context_window', None)
+        if not context_window:
+            return None
+        if self._max_paragraph_tokens is None:
+            templates = [create_prompt("") for create_prompt in self.paragraph_criteria.values()]
+            templates += [self._create_coherence_prompt("", ""), self._create_combined_prompt("")]
+            overhead = max(self.tokens.count_prompt(template) for template in templates)
+            self._max_paragraph_tokens = max(1, (context_window - overhead - self.OUTPUT_TOKEN_RESERVE) // 2)
+        return self._max_paragraph_tokens
+
+    async def _fit_section(self, section: Dict[str, Any]):
+        """在线程池中批量预先计数章节的全部段落，并拆分超过上下文窗口的段落"""
+        levels = [section] + section.get('subsections', [])
+        await self.tokens.precount(paragraph for level in levels for paragraph in level['paragraphs'])
+        self.fit_section(section)
+
+    def fit_section(self, section: Dict[str, Any]):
+        """
+        拆分章节中超过上下文窗口的段落（原地修改）
+        分布式提交和批量模式在枚举评估单元前同样调用，单元ID和输入与本地运行一致
+        """
+        max_tokens = self.max_paragraph_tokens()
+        if max_tokens is None:
+            return
+        for level in [section] + section.get('subsections', []):
+            if any(self.tokens.count(paragraph) > max_tokens for paragraph in level['paragraphs']):
+                Logger.log_warning(self.logger, f"章节 {level['title']} 中有段落超过 {max_tokens} 个令牌，已拆分")
+                level['paragraphs'] = [chunk for paragraph in level['paragraphs'] for chunk in self.tokens.split_text(paragraph, max_tokens)]
+
+    def _plan_section(self, graph: TaskGraphScheduler, index: int, section: Dict[str, Any]):
+        """添加一个章节的评估单元，以及依赖这些单元的汇总单元"""
+        unit_ids = [self._add_unit(graph, unit_id, unit) for unit_id, unit in self._section_units(index, section)]
+        graph.add(f"{index}/scores", self._summary_unit(graph, index, section), deps=unit_ids, uses_capacity=False)
+
+    def iter_units(self, sections: List[Dict[str, Any]]):
+        """
+        枚举整篇文档中需要调用模型的评估单元，产出 (单元ID, 单元描述)
+        单元描述只包含可JSON序列化的输入，可以交给 run_unit 在任意进程中执行
+        """
+        for index, section in enumerate(sections):
+            yield from self._section_units(index, section)
+        for index in range(len(sections) - 1):
+            yield f"section/{index}", self._section_pair_unit(sections[index], sections[index + 1])
+
+    def _section_units(self, index: int, section: Dict[str, Any]):
+        """将一个章节拆分为 (章节, 评估标准, 段落) 和段落对连贯性评估单元"""
+        title = section['title']
+        if self.combined_criteria:
+            # 每个段落一次调用，结果中包含全部按段落评估的标准
+            for j, paragraph in enumerate(section['paragraphs']):
+                yield f"{index}/combined/{j}", {"kind": "combined", "title": title, "paragraph": paragraph}
+        else:
+            for criterion in self.paragraph_criteria:
+                for j, paragraph in enumerate(section['paragraphs']):
+                    yield f"{index}/{criterion}/{j}", {"kind": "paragraph", "title": title, "criterion": criterion, "paragraph": paragraph}
+        for j, (paragraph1, paragraph2, meta) in enumerate(self._coherence_pairs(section)):
+            yield f"{index}/{self.COHERENCE_CRITERION}/{j}", {
+                "kind": "coherence", "title": title, "paragraph1": paragraph1, "paragraph2": paragraph2, "meta": meta
+            }
 
-    def _create_section_coherence_prompt(self, section1: Dict[str, Any], section2: Dict[str, Any]) -> str:
-        prompt = f"""请评估以下两个连续章节之间的"逻辑连贯性和结构"：
+    @staticmethod
+    def _section_pair_unit(section1: Dict[str, Any], section2: Dict[str, Any]) -> Dict[str, Any]:
+        """相邻章节连贯性单元，只保留衔接处的段落"""
+        return {
+            "kind": "section",
+            "section1": {"title": section1['title'], "parent_title": section1.get('parent_title'), "paragraphs": section1['paragraphs'][-1:]},
+            "section2": {"title": section2['title'], "parent_title": section2.get('parent_title'), "paragraphs": section2['paragraphs'][:1]}
+        }
 
-章节1标题：{section1['title']}
-章节1最后一段：{section1['paragraphs'][-1]}
+    @classmethod
+    def unit_criterion(cls, unit: Dict[str, Any]) -> str:
+        """评估单元对应的评分标准，用作指标标签"""
+        return {
+            "combined": "combined",
+            "paragraph": unit.get('criterion'),
+            "coherence": cls.COHERENCE_CRITERION,
+            "section": "章节连贯性"
+        }[unit['kind']]
+
+    async def run_unit(self, unit: Dict[str, Any]):
+        """执行一个评估单元并返回结果"""
+        criterion = self.unit_criterion(unit)
+        section = unit.get('title') or f"{unit['section1']['title']} -> {unit['section2']['title']}"
+        with metric_labels(criterion=criterion), trace_attrs(section=section, criterion=criterion):
+            with tracer.span("unit", kind=unit['kind']):
+                return await self._run_unit(unit)
+
+    @staticmethod
+    def _build_prompt(create_prompt, *args) -> str:
+        with tracer.span("prompt_build"):
+            return create_prompt(*args)
+
+    async def _run_unit(self, unit: Dict[str, Any]):
+        skipped = self._skipped_unit_result(unit)
+        if skipped is not None:
+            return skipped
+        if unit['kind'] == "combined":
+            return await self._evaluate_combined(unit['paragraph'])
+        prompt, _ = self.unit_prompt(unit)
+        result = await self._evaluate_prompt(prompt)
+        return {**unit['meta'], **result} if unit['kind'] == "coherence" else result
+
+    @staticmethod
+    def _skipped_unit_result(unit: Dict[str, Any]):
+        """不需要调用模型的章节连贯性单元直接给出结果，其余单元返回None"""
+        if unit['kind'] != "section":
+            return None
+        section1, section2 = unit['section1'], unit['section2']
+        if section1.get('parent_title') != section2.get('parent_title'):
+            return {
+                "score": None,
+                "explanation": "相邻章节属于不同的大标题，不评估连贯性。"
+            }
+        if not section1['paragraphs'] or not section2['paragraphs']:
+            return {
+                "score": None,
+                "explanation": "章节缺少正文段落，不评估连贯性。"
+            }
+        return None
+
+    def unit_prompt(self, unit: Dict[str, Any]) -> tuple:
+        """
+        评估单元的 (提示词, 输出JSON Schema)，不需要调用模型的单元返回 (None, None)
+        供批量模式把全部单元写入 Batch API 的输入文件
+        """
+        if self._skipped_unit_result(unit) is not None:
+            return None, None
+        kind = unit['kind']
+        if kind == "combined":
+            return self._build_prompt(self._create_combined_prompt, unit['paragraph']), multi_score_schema(list(self.paragraph_criteria))
+        if kind == "paragraph":
+            return self._build_prompt(self.paragraph_criteria[unit['criterion']], unit['paragraph']), EVALUATION_SCHEMA
+        if kind == "coherence":
+            return self._build_prompt(self._create_coherence_prompt, unit['paragraph1'], unit['paragraph2']), EVALUATION_SCHEMA
+        return self._build_prompt(self._create_section_coherence_prompt, unit['section1'], unit['section2']), EVALUATION_SCHEMA
+
+    async def unit_result(self, unit: Dict[str, Any], response: Optional[str]):
+        """
+        把批量模式取回的模型输出解析为与 run_unit 相同格式的结果
+        response 为None表示该单元的批量请求失败，评分记为None
+        """
+        skipped = self._skipped_unit_result(unit)
+        if skipped is not None:
+            return skipped
+        if unit['kind'] == "combined":
+            parsed = self.parser.parse_multi_score_response(response, list(self.paragraph_criteria))
+            missing = "批量评估失败" if response is None else "批量评估未返回该标准的评分"
+            return {
+                criterion: {"score": parsed[criterion][0], "explanation": parsed[criterion][1]} if criterion in parsed
+                else {"score": None, "explanation": missing}
+                for criterion in self.paragraph_criteria
+            }
+        if response is None:
+            result = {"score": None, "explanation": "批量评估失败"}
+        else:
+            score, explanation = await self._parse_model_response(response)
+            result = {"score": score, "explanation": explanation}
+        return {**unit['meta'], **result} if unit['kind'] == "coherence" else result
+
+    def _unit_reuse(self, unit: Dict[str, Any]) -> tuple:
+        """返回评估单元的 (输入内容指纹, 上次评估中可复用的结果)"""
+        previous = self.previous_results
+        kind = unit['kind']
+        if kind == "combined":
+            return self._unit_key(unit['paragraph']), self._reuse_combined(unit['title'], unit['paragraph'])
+        if kind == "paragraph":
+            return (self._unit_key(unit['paragraph']),
+                    previous.get_paragraph_score(unit['title'], unit['criterion'], unit['paragraph']) if previous else None)
+        if kind == "coherence":
+            meta = unit['meta']
+            key = self._unit_key(unit['paragraph1'], unit['paragraph2'], str(meta.get('type')), str(meta.get('title')))
+            return key, previous.get_coherence_score(unit['title'], unit['paragraph1'], unit['paragraph2'], meta) if previous else None
+        section1, section2 = unit['section1'], unit['section2']
+        key = self._unit_key(section1['title'], section1['paragraphs'][-1] if section1['paragraphs'] else "",
+                             section2['title'], section2['paragraphs'][0] if section2['paragraphs'] else "")
+        return key, previous.get_section_coherence(section1, section2) if previous else None
+
+    def _add_unit(self, graph: TaskGraphScheduler, unit_id: str, unit: Dict[str, Any]) -> str:
+        """将评估单元加入任务图，可复用的结果直接写入"""
+        key, previous = self._unit_reuse(unit)
+        if not self._reuse(graph, unit_id, key, previous):
+            graph.add(unit_id, lambda: self.run_unit(unit))
+        return unit_id
+
+    def _summary_unit(self, graph: TaskGraphScheduler, index: int, section: Dict[str, Any]):
+        async def summarize():
+            section['scores'] = self._section_scores(index, section, graph.results)
+            return section['scores']
+        return summarize
+
+    def _section_scores(self, index: int, section: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+        """由评估单元的结果汇总一个章节的各项评分"""
+        scores = {}
+        paragraph_count = len(section['paragraphs'])
+        for criterion in self.criteria:
+            if criterion == self.COHERENCE_CRITERION:
+                items = [results[f"{index}/{criterion}/{j}"] for j in range(len(self._coherence_pairs(section)))]
+                scores[criterion] = self._summarize_coherence_scores(items)
+                continue
+            if self.combined_criteria:
+                items = [results[f"{index}/combined/{j}"][criterion] for j in range(paragraph_count)]
+            else:
+                items = [results[f"{index}/{criterion}/{j}"] for j in range(paragraph_count)]
+            scores[criterion] = self._summarize_paragraph_scores(criterion, items)
+        return scores
 
-章节2标题：{section2['title']}
-章节2第一段：{section2['paragraphs'][0]}
+    def assemble(self, sections: List[Dict[str, Any]], results: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """根据 单元ID -> 结果 写回各章节的评分和章节间连贯性"""
+        for index, section in enumerate(sections):
+            section['scores'] = self._section_scores(index, section, results)
+        for index in range(len(sections) - 1):
+            sections[index]['section_coherence'] = results[f"section/{index}"]
+        return sections
+
+    @staticmethod
+    def _unit_key(*parts) -> str:
+        """评估单元输入内容的指纹，检查点中的结果只在输入未变化时复用"""
+        return paragraph_hash("\x00".join(parts))
+
+    @staticmethod
+    def _is_complete(result) -> bool:
+        if 'score' in result:
+            return result['score'] is not None
+        # 合并评估的结果：评分标准 -> 结果
+        return all(item.get('score') is not None for item in result.values())
+
+    def _reuse(self, graph: TaskGraphScheduler, unit_id: str, key: str, previous=None) -> bool:
+        """若检查点日志或上次评估有可复用的结果，直接写入任务图而不再调用模型"""
+        self.unit_keys[unit_id] = key
+        entry = self.journal_entries.get(unit_id)
+        if entry is not None and entry[0] == key:
+            graph.set_result(unit_id, entry[1])
+            self.resumed_units += 1
+            return True
+        if previous is None:
+            return False
+        graph.set_result(unit_id, previous)
+        self.reused_units += 1
+        return True
+
+    def _reuse_combined(self, title: str, paragraph: str):
+        if not self.previous_results:
+            return None
+        results = {criterion: self.previous_results.get_paragraph_score(title, criterion, paragraph) for criterion in self.paragraph_criteria}
+        return results if all(results.values()) else None
+
+    def clear_checkpoint(self):
+        CheckpointJournal(self.checkpoint_file).clear()
+
+    def _create_section_coherence_prompt(self, section1: Dict[str, Any], section2: Dict[str, Any]) -> str:
+        prompt = f"""请评估文末两个连续章节之间的"逻辑连贯性和结构"：
 
 评分标准：
 1分（很差）：{self.grade_descriptions["逻辑连贯性和结构"][1]}
@@ -407,14 +798,23 @@ class AIEvaluator:
 请特别注意章节之间的衔接是否自然，逻辑是否连贯。给出评分（1-5）并简要解释原因。
 
 ***输出格式***
-输出格式：{{"reasoning":{{"解释一步一步评估的过程"}},"result":{{"score": 评分, "explanation": "简要解释"}}}}
+输出格式：{{"reasoning": "解释一步一步评估的过程", "result":{{"score": 评分, "explanation": "简要解释"}}}}
 
 请确保您的回答严格遵循这个格式。
+
+章节1标题：{section1['title']}
+章节1最后一段：{section1['paragraphs'][-1]}
+
+章节2标题：{section2['title']}
+章节2第一段：{section2['paragraphs'][0]}
 """
         return prompt
 
-    def save_results(self, evaluated_sections: List[Dict[str, Any]], original_filename: str):
-        """评估结果保存为JSON文件，文件名包含时间戳和原始文件名"""
+    def save_results(self, evaluated_sections: List[Dict[str, Any]], original_filename: str, clear_checkpoint: bool = True):
+        """
+        评估结果保存为JSON文件，文件名包含时间戳和原始文件名
+        clear_checkpoint 为False时保留检查点日志（批量模式不写日志，也不应删除本地运行留下的日志）
+        """
         # 生成时间戳
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
@@ -439,9 +839,15 @@ class AIEvaluator:
         
         print(f"评估结果已保存到: {result_filename}")
         
-        # 评估完成后删除检查点文件
-        if os.path.exists(self.checkpoint_file):
-            os.remove(self.checkpoint_file)
+        # 在结果旁边保存本文档的调用指标摘要
+        match = {"item": self.item_key} if self.item_key is not None else {}
+        metrics.write_summary(os.path.join("evaluation_results", f"metrics_{base_filename}_{timestamp}.json"), **match)
+        
+        # 评估完成后删除检查点日志
+        if clear_checkpoint:
+            self.clear_checkpoint()
+        
+        return os.path.join("evaluation_results", result_filename)
 
     async def _parse_model_response(self, response: str) -> tuple:
         return await self.parser.parse_model_response(response)
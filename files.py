@@ -1,5 +1,8 @@
 import re
 import os
+import mmap
+import hashlib
+from array import array
 
 class TextProcessor:
     def __init__(self, file_path):
@@ -7,6 +10,14 @@ class TextProcessor:
         self.sections = []
 
     def process(self):
+        self.sections.extend(self.iter_sections())
+        return self.sections
+
+    def iter_sections(self):
+        """
+        逐个产出一级章节（"一、"标题），读到下一个一级标题时即产出上一个章节
+        只保留当前章节在内存中，评估器可以在文件其余部分仍在读取时开始评估
+        """
         try:
             current_section = None
             current_subsection = None
@@ -20,7 +31,7 @@ class TextProcessor:
                         # 新章节
                         if current_section:
                             self._add_paragraphs_to_current_level(current_section, current_paragraphs)
-                            self.sections.append(current_section)
+                            yield current_section
                         current_section = {"title": line, "paragraphs": [], "subsections": []}
                         current_subsection = None
                         current_subsubsection = None
@@ -49,13 +60,10 @@ class TextProcessor:
             # 处理最后的段落和章节
             self._add_paragraphs_to_current_level(current_subsubsection or current_subsection or current_section, current_paragraphs)
             if current_section:
-                self.sections.append(current_section)
-
-            return self.sections
+                yield current_section
         except OSError as e:
             print(f"无法打开文件: {self.file_path}")
             print(f"错误信息: {str(e)}")
-            return []  # 或者根据需要返回适当的值
 
     def _add_paragraphs_to_current_level(self, current_level, paragraphs):
         if current_level is not None and paragraphs:
@@ -63,13 +71,16 @@ class TextProcessor:
                 current_level["paragraphs"] = []
             current_level["paragraphs"].append(" ".join(paragraphs))
 
-    def _is_main_title(self, line):
+    @staticmethod
+    def _is_main_title(line):
         return re.match(r'^[零一二三四五六七八九十]+、', line)
 
-    def _is_subtitle(self, line):
+    @staticmethod
+    def _is_subtitle(line):
         return re.match(r'^[1-9]\d*\s', line)
 
-    def _is_subsubtitle(self, line):
+    @staticmethod
+    def _is_subsubtitle(line):
         return re.match(r'^[1-9]\d*\.[1-9]\d*\s', line)
 
     def get_section_count(self):
@@ -106,6 +117,216 @@ class TextProcessor:
                         print(f"          段落 {l}: {para[:100]}...")
             print()
 
+    def load_mapped(self):
+        """返回基于内存映射的紧凑文档表示，段落文本按需解码"""
+        return MappedDocument(self.file_path)
+
+    def section_digests(self):
+        """各一级章节的标题和段落摘要（见 MappedDocument.section_digests），文件无法打开时返回None"""
+        try:
+            with self.load_mapped() as document:
+                return document.section_digests()
+        except OSError:
+            return None
+
+
+class DocumentNode:
+    """标题节点（一级、二级或三级），标题和段落文本都在访问时才从映射的文件中解码"""
+    __slots__ = ('document', 'index', 'level', 'title_offset', 'title_length', 'parent', 'children', 'paragraphs')
+
+    def __init__(self, document, index, level, title_offset, title_length, parent):
+        self.document = document
+        self.index = index
+        self.level = level
+        self.title_offset = title_offset
+        self.title_length = title_length
+        self.parent = parent
+        self.children = []
+        # 属于该节点的段落在段落表中的下标
+        self.paragraphs = array('l')
+
+    @property
+    def title(self):
+        return self.document.decode(self.title_offset, self.title_length).strip()
+
+    def paragraph_views(self):
+        return [ParagraphView(self.document, i) for i in self.paragraphs]
+
+    def digests(self):
+        """(标题, 段落摘要, 子节点摘要)，不解码段落文本，结构与 incremental.section_digests 一致"""
+        return (self.title, tuple(self.document.paragraph_hash(i) for i in self.paragraphs),
+                tuple(child.digests() for child in self.children))
+
+    def to_dict(self):
+        """与 TextProcessor.process() 相同结构的字典"""
+        result = {"title": self.title, "paragraphs": [self.document.paragraph_text(i) for i in self.paragraphs]}
+        if self.level == 0:
+            result["subsections"] = [child.to_dict() for child in self.children]
+        elif self.level == 1:
+            result["subsubsections"] = [child.to_dict() for child in self.children]
+        return result
+
+
+class ParagraphView:
+    """段落表中一行的轻量视图，不持有文本副本"""
+    __slots__ = ('document', 'index')
+
+    def __init__(self, document, index):
+        self.document = document
+        self.index = index
+
+    @property
+    def offset(self):
+        return self.document.offsets[self.index]
+
+    @property
+    def length(self):
+        return self.document.lengths[self.index]
+
+    @property
+    def level(self):
+        return self.document.levels[self.index]
+
+    @property
+    def parent(self):
+        return self.document.nodes[self.document.parents[self.index]]
+
+    @property
+    def hash(self):
+        return self.document.paragraph_hash(self.index)
+
+    @property
+    def text(self):
+        return self.document.paragraph_text(self.index)
+
+    def __str__(self):
+        return self.text
+
+
+class MappedDocument:
+    """
+    内存映射的紧凑文档模型
+    段落表以数组保存每个段落在源文件中的字节偏移、长度、层级、所属标题节点和内容哈希，
+    文本只在访问时解码，分析、缓存和比对可以直接使用哈希和偏移而不复制字符串
+    段落划分规则与 TextProcessor.process() 一致，to_sections() 提供兼容的字典视图
+    """
+
+    def __init__(self, file_path):
+        self.file_path = os.path.normpath(file_path)
+        self.offsets = array('q')
+        self.lengths = array('l')
+        self.levels = array('b')
+        self.parents = array('l')
+        # 每个段落20字节的SHA-1摘要，与 incremental.paragraph_hash 的结果一致
+        self.hashes = bytearray()
+        self.nodes = []
+        self.sections = []
+        self._file = open(self.file_path, 'rb')
+        try:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空文件无法映射
+            self._data = b""
+        self._scan()
+
+    def _scan(self):
+        data = self._data
+        end = len(data)
+        pos = 0
+        section = subsection = subsubsection = None
+        pending = None
+
+        def flush(target):
+            nonlocal pending
+            if pending is not None and target is not None:
+                self._add_paragraph(pending[0], pending[1] - pending[0], target)
+            pending = None
+
+        while pos < end:
+            newline = data.find(b"\n", pos)
+            if newline == -1:
+                newline = end
+            line = data[pos:newline].decode('utf-8').strip()
+            if TextProcessor._is_main_title(line):
+                flush(section)
+                section = self._add_node(0, pos, newline - pos, None)
+                self.sections.append(section)
+                subsection = subsubsection = None
+            elif TextProcessor._is_subtitle(line):
+                flush(section)
+                subsection = self._add_node(1, pos, newline - pos, section)
+                subsubsection = None
+            elif TextProcessor._is_subsubtitle(line):
+                flush(subsection)
+                subsubsection = self._add_node(2, pos, newline - pos, subsection)
+            elif line:
+                # 非空行：扩展当前段落的字节范围
+                pending = (pending[0] if pending else pos, newline)
+            else:
+                # 空行，表示段落结束
+                flush(subsubsection or subsection or section)
+            pos = newline + 1
+        flush(subsubsection or subsection or section)
+
+    def _add_node(self, level, offset, length, parent):
+        node = DocumentNode(self, len(self.nodes), level, offset, length, parent)
+        self.nodes.append(node)
+        if parent is not None:
+            parent.children.append(node)
+        return node
+
+    def _add_paragraph(self, offset, length, node):
+        index = len(self.offsets)
+        self.offsets.append(offset)
+        self.lengths.append(length)
+        self.levels.append(node.level)
+        self.parents.append(node.index)
+        self.hashes += hashlib.sha1(self._join(offset, length).encode('utf-8')).digest()
+        node.paragraphs.append(index)
+
+    def decode(self, offset, length):
+        return self._data[offset:offset + length].decode('utf-8')
+
+    def _join(self, offset, length):
+        # 与 TextProcessor 相同：段落内各行去除首尾空白后以空格连接
+        return " ".join(line.strip() for line in self.decode(offset, length).split("\n"))
+
+    def paragraph_text(self, index):
+        return self._join(self.offsets[index], self.lengths[index])
+
+    def paragraph_hash(self, index):
+        return self.hashes[index * 20:(index + 1) * 20].hex()
+
+    def paragraph(self, index):
+        return ParagraphView(self, index)
+
+    @property
+    def paragraph_count(self):
+        return len(self.offsets)
+
+    def iter_sections(self):
+        """逐个产出一级章节的字典视图"""
+        for section in self.sections:
+            yield section.to_dict()
+
+    def to_sections(self):
+        return list(self.iter_sections())
+
+    def section_digests(self):
+        """各一级章节的标题和段落摘要，增量评估用它判断文档是否变化"""
+        return [section.digests() for section in self.sections]
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
 # 使用示例
 if __name__ == "__main__":
     file_path = r"长文本文件\a.txt"  # 使用原始字符串
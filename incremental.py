@@ -0,0 +1,90 @@
+import hashlib
+import json
+
+
+def paragraph_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def section_digests(section):
+    """章节（含各级子章节）的 (标题, 段落哈希, 子章节摘要)，与 MappedDocument.section_digests() 的元素一致"""
+    children = section.get('subsections') or section.get('subsubsections') or []
+    return (section['title'], tuple(paragraph_hash(paragraph) for paragraph in section['paragraphs']),
+            tuple(section_digests(child) for child in children))
+
+
+class PreviousResults:
+    """
+    上一次评估结果的索引，用于增量评估
+    按章节标题和段落内容哈希定位可以复用的评分，内容未变化的段落、段落对和章节对不再重新评估
+    """
+
+    def __init__(self, sections, coherence_pairs):
+        # coherence_pairs: 与评估器一致的相邻段落对划分函数
+        self.paragraph_scores = {}
+        self.coherence_scores = {}
+        self.section_coherence = {}
+        self.section_count = len(sections)
+        self.digests = [section_digests(section) for section in sections]
+        # 每个章节评估过的标准；有失败的评分（None）时不能整体复用
+        self.criteria = [set(section.get('scores', {})) for section in sections]
+        self.complete = True
+
+        for section in sections:
+            title = section['title']
+            scores = section.get('scores', {})
+            for criterion, result in scores.items():
+                for paragraph, item in zip(section['paragraphs'], result.get('paragraph_scores', [])):
+                    if item.get('score') is not None:
+                        self.paragraph_scores[(title, criterion, paragraph_hash(paragraph))] = item
+                    else:
+                        self.complete = False
+                if 'coherence_scores' in result:
+                    pairs = coherence_pairs(section)
+                    for (paragraph1, paragraph2, meta), item in zip(pairs, result['coherence_scores']):
+                        if item.get('score') is not None:
+                            self.coherence_scores[self._pair_key(title, paragraph1, paragraph2, meta)] = item
+                        else:
+                            self.complete = False
+
+        for section1, section2 in zip(sections, sections[1:]):
+            item = section1.get('section_coherence')
+            if not section1['paragraphs'] or not section2['paragraphs']:
+                continue
+            if item and item.get('score') is not None:
+                self.section_coherence[self._section_key(section1, section2)] = item
+            else:
+                self.complete = False
+
+    @classmethod
+    def from_file(cls, result_file_path, coherence_pairs):
+        with open(result_file_path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f)['sections'], coherence_pairs)
+
+    def unchanged(self, digests, criteria):
+        """
+        digests 为 MappedDocument.section_digests()：标题和全部段落摘要都与上次相同、
+        评估标准一致且上次没有失败的评分时返回True，整篇文档无需重新评估，也不必解码段落文本
+        """
+        criteria = set(criteria)
+        return self.complete and digests == self.digests and all(scored == criteria for scored in self.criteria)
+
+    @staticmethod
+    def _pair_key(title, paragraph1, paragraph2, meta):
+        return (title, meta.get('type'), meta.get('title'), paragraph_hash(paragraph1), paragraph_hash(paragraph2))
+
+    @staticmethod
+    def _section_key(section1, section2):
+        return (section1['title'], paragraph_hash(section1['paragraphs'][-1]),
+                section2['title'], paragraph_hash(section2['paragraphs'][0]))
+
+    def get_paragraph_score(self, title, criterion, paragraph):
+        return self.paragraph_scores.get((title, criterion, paragraph_hash(paragraph)))
+
+    def get_coherence_score(self, title, paragraph1, paragraph2, meta):
+        return self.coherence_scores.get(self._pair_key(title, paragraph1, paragraph2, meta))
+
+    def get_section_coherence(self, section1, section2):
+        if not section1['paragraphs'] or not section2['paragraphs']:
+            return None
+        return self.section_coherence.get(self._section_key(section1, section2))
@@ -0,0 +1,143 @@
+import json
+import os
+import sqlite3
+import time
+
+
+class JobStore:
+    """
+    基于SQLite的分布式评估任务库，可放在共享文件系统上供多台机器上的工作进程使用
+    每个评估单元是一条任务：工作进程以限时租约领取任务、写回结果，租约过期的任务可被其他工作进程重新领取
+    """
+
+    def __init__(self, path="jobs/jobs.sqlite3", max_attempts=3):
+        self.path = path
+        # 单元评估失败（评分为None）时最多尝试的次数，超过后按失败结果完成
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 共享文件系统上不能使用WAL模式，依赖默认的回滚日志和忙等待超时
+        self.conn = sqlite3.connect(path, isolation_level=None, timeout=60, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "item_key TEXT PRIMARY KEY, file_path TEXT NOT NULL, settings TEXT NOT NULL, sections TEXT NOT NULL, "
+            "merged INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "item_key TEXT NOT NULL, unit_id TEXT NOT NULL, unit TEXT NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'pending', worker TEXT, lease_expires REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, result TEXT, "
+            "PRIMARY KEY (item_key, unit_id))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, lease_expires)")
+
+    def add_item(self, item_key, file_path, settings, sections, units):
+        """
+        登记一个数据集项目及其全部评估单元
+        重复提交同一项目时保留已完成的结果，只更新内容发生变化的单元
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO items (item_key, file_path, settings, sections, merged) VALUES (?, ?, ?, ?, 0)",
+                (item_key, file_path, json.dumps(settings, ensure_ascii=False), json.dumps(sections, ensure_ascii=False))
+            )
+            existing = dict(self.conn.execute("SELECT unit_id, unit FROM jobs WHERE item_key = ?", (item_key,)).fetchall())
+            unit_ids = set()
+            for unit_id, unit in units:
+                unit_ids.add(unit_id)
+                unit_json = json.dumps(unit, ensure_ascii=False, sort_keys=True)
+                if existing.get(unit_id) == unit_json:
+                    continue
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO jobs (item_key, unit_id, unit) VALUES (?, ?, ?)",
+                    (item_key, unit_id, unit_json)
+                )
+            for unit_id in set(existing) - unit_ids:
+                self.conn.execute("DELETE FROM jobs WHERE item_key = ? AND unit_id = ?", (item_key, unit_id))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def claim(self, worker, lease_seconds=120, limit=1):
+        """领取最多 limit 个待执行或租约已过期的任务，返回 [(项目, 单元ID, 单元描述)]"""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute(
+                "SELECT item_key, unit_id, unit FROM jobs "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY attempts, item_key LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            for item_key, unit_id, _ in rows:
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ? WHERE item_key = ? AND unit_id = ?",
+                    (worker, now + lease_seconds, item_key, unit_id)
+                )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return [(item_key, unit_id, json.loads(unit)) for item_key, unit_id, unit in rows]
+
+    def renew(self, worker, lease_seconds=120):
+        """延长某个工作进程持有的全部租约"""
+        self.conn.execute(
+            "UPDATE jobs SET lease_expires = ? WHERE status = 'leased' AND worker = ?",
+            (time.time() + lease_seconds, worker)
+        )
+
+    def complete(self, item_key, unit_id, result):
+        """写回任务结果，已被其他工作进程完成的任务保持不变"""
+        self.conn.execute(
+            "UPDATE jobs SET status = 'done', result = ?, lease_expires = NULL WHERE item_key = ? AND unit_id = ? AND status != 'done'",
+            (json.dumps(result, ensure_ascii=False), item_key, unit_id)
+        )
+
+    def fail(self, item_key, unit_id, result):
+        """记录一次失败：未超过最大尝试次数时放回队列，否则以失败结果完成"""
+        self.conn.execute(
+            "UPDATE jobs SET attempts = attempts + 1, status = 'pending', worker = NULL, lease_expires = NULL "
+            "WHERE item_key = ? AND unit_id = ? AND status != 'done'",
+            (item_key, unit_id)
+        )
+        self.conn.execute(
+            "UPDATE jobs SET status = 'done', result = ? WHERE item_key = ? AND unit_id = ? AND status = 'pending' AND attempts >= ?",
+            (json.dumps(result, ensure_ascii=False), item_key, unit_id, self.max_attempts)
+        )
+
+    def get_item(self, item_key):
+        row = self.conn.execute("SELECT file_path, settings, sections FROM items WHERE item_key = ?", (item_key,)).fetchone()
+        if row is None:
+            return None
+        return {"file_path": row[0], "settings": json.loads(row[1]), "sections": json.loads(row[2])}
+
+    def finished_items(self):
+        """返回全部任务已完成且尚未合并的项目"""
+        rows = self.conn.execute(
+            "SELECT item_key FROM items WHERE merged = 0 AND NOT EXISTS ("
+            "SELECT 1 FROM jobs WHERE jobs.item_key = items.item_key AND jobs.status != 'done')"
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def results(self, item_key):
+        rows = self.conn.execute("SELECT unit_id, result FROM jobs WHERE item_key = ? AND status = 'done'", (item_key,)).fetchall()
+        return {unit_id: json.loads(result) for unit_id, result in rows}
+
+    def mark_merged(self, item_key):
+        self.conn.execute("UPDATE items SET merged = 1 WHERE item_key = ?", (item_key,))
+
+    def stats(self):
+        counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {
+            "pending": counts.get('pending', 0),
+            "leased": counts.get('leased', 0),
+            "done": counts.get('done', 0)
+        }
+
+    def close(self):
+        self.conn.close()
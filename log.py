@@ -1,36 +1,108 @@
+import atexit
+import hashlib
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
 from datetime import datetime
 
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，附加字段来自 extra={"fields": {...}}"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16] if text is not None else None
+
+
 class Logger:
+    # 进程内只初始化一次：日志记录先进入内存队列，由后台线程写入按大小轮转的文件
+    _listener = None
+    # 完整记录提示词和响应文本的抽样比例，其余只记录哈希和长度
+    sample_rate = 0.0
+
     @staticmethod
-    def setup_logging():
-        os.makedirs('logs', exist_ok=True)
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('logs/app.log', 'a', encoding='utf-8')
-            ]
-        )
+    def setup_logging(config=None):
+        """
+        初始化日志系统并返回日志记录器，重复调用直接返回
+        config: config.json 中的 logging 配置（path、level、max_bytes、backup_count、sample_rate）
+        """
+        if Logger._listener is None:
+            config = config or {}
+            path = config.get('path', 'logs/app.log')
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=config.get('max_bytes', 10 * 1024 * 1024),
+                backupCount=config.get('backup_count', 5), encoding='utf-8'
+            )
+            file_handler.setFormatter(JsonFormatter())
+            log_queue = queue.SimpleQueue()
+            root = logging.getLogger()
+            root.setLevel(config.get('level', 'INFO'))
+            root.addHandler(logging.handlers.QueueHandler(log_queue))
+            Logger.sample_rate = config.get('sample_rate', 0.0)
+            Logger._listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+            Logger._listener.start()
+            atexit.register(Logger.shutdown)
         return logging.getLogger(__name__)
 
+    @staticmethod
+    def shutdown():
+        """写完队列中剩余的日志并停止后台线程"""
+        if Logger._listener is not None:
+            Logger._listener.stop()
+
+    @staticmethod
+    def _sampled():
+        return Logger.sample_rate > 0 and random.random() < Logger.sample_rate
+
     @staticmethod
     def log_model_io(logger, prompt, response):
-        logger.info(f"Prompt: {prompt}")
-        logger.info(f"Response: {response}")
+        fields = {
+            "event": "model_io",
+            "prompt_hash": _digest(prompt),
+            "prompt_length": len(prompt),
+            "response_hash": _digest(response),
+            "response_length": len(response) if response is not None else None
+        }
+        if response is None:
+            # 调用失败时保留完整提示词
+            fields["prompt"] = prompt
+            logger.warning("模型未返回响应", extra={"fields": fields})
+            return
+        if Logger._sampled():
+            fields["prompt"] = prompt
+            fields["response"] = response
+        logger.info("模型调用", extra={"fields": fields})
 
     @staticmethod
     def log_parsing_result(logger, score, explanation):
-        logger.info(f"Parsed response - Score: {score}, Explanation: {explanation}")
+        logger.info("解析结果", extra={"fields": {"event": "parsed", "score": score, "explanation": explanation}})
 
     @staticmethod
     def log_parsing_error(logger, error, response):
-        logger.error(f"Error parsing response: {error}\nResponse: {response}")
+        # 解析失败时保留完整响应文本，便于排查
+        logger.error(f"解析失败: {error}", extra={"fields": {"event": "parse_error", "response": response}})
 
     @staticmethod
     def log_ai_assisted_parsing(logger, score, explanation):
-        logger.info(f"AI-assisted parsing result - Score: {score}, Explanation: {explanation}")
+        logger.info("AI辅助解析结果", extra={"fields": {"event": "ai_assisted_parsed", "score": score, "explanation": explanation}})
 
     @staticmethod
     def log_warning(logger, message):
@@ -1,12 +1,30 @@
+import argparse
 import json
 import os
 import asyncio
+import socket
 import sys
 from datetime import datetime
 from evaluate import AIEvaluator
 from analysis import ResultAnalyzer
 from files import TextProcessor
+from incremental import PreviousResults
 from model.siliconflow_model import SiliconFlowModel
+from model.cache import ResponseCache
+from model.retry import RetryPolicy, RetryBudget
+from model.concurrency import AdaptiveConcurrencyController
+from model.tokens import TokenCounter
+from model.transport import Cassette
+from model.batch_client import BatchClient
+from work_queue import WorkQueue
+from jobstore import JobStore
+from distributed import submit_items, run_worker, merge_results
+from batch import plan_items, BatchState, run_batches, assemble_items
+from log import Logger
+from metrics import metrics
+from tracing import tracer
+
+EXPECTED_STYLE = "遵循特定人工智能领域的规范，保持准确性、客观性、一致性和清晰性，具备良好的组织结构，并在写作前深入思考核心内容和表达方式。"
 
 def load_dataset(json_file):
     with open(json_file, 'r', encoding='utf-8') as f:
@@ -14,65 +32,178 @@ def load_dataset(json_file):
 
 def load_config():
     with open('config.json', 'r', encoding='utf-8') as f:
-        return json.load(f)
+        config = json.load(f)
+    # 日志系统每个进程只初始化一次，之后 AIEvaluator 等模块直接复用
+    Logger.setup_logging(config.get('logging'))
+    return config
+
+def create_cache(config):
+    cache_config = config.get('cache', {})
+    if not cache_config.get('enabled', False):
+        return None
+    max_age_days = cache_config.get('max_age_days')
+    return ResponseCache(
+        path=cache_config.get('path', 'cache/responses.sqlite3'),
+        max_entries=cache_config.get('max_entries'),
+        max_bytes=cache_config.get('max_bytes'),
+        max_age=max_age_days * 86400 if max_age_days is not None else None,
+        bypass=cache_config.get('bypass', False)
+    )
+
+def create_retry_policy(config):
+    retry_config = config.get('retry', {})
+    return RetryPolicy(
+        max_attempts=retry_config.get('max_attempts', 5),
+        base_delay=retry_config.get('base_delay', 1.0),
+        max_delay=retry_config.get('max_delay', 60.0),
+        budget=RetryBudget(retry_config.get('budget'))
+    )
+
+def create_concurrency_controller(config):
+    concurrency_config = config.get('concurrency', {})
+    return AdaptiveConcurrencyController(
+        initial=concurrency_config.get('initial', 8),
+        min_limit=concurrency_config.get('min', 1),
+        max_limit=concurrency_config.get('max', 64)
+    )
+
+def create_transport(config):
+    """
+    按配置创建录制/回放磁带：record 录制本次运行的全部请求，replay 从磁带回放而不访问网络
+    passthrough（默认）直接访问网络，返回None
+    """
+    transport_config = config.get('transport', {})
+    mode = transport_config.get('mode', 'passthrough')
+    if mode == 'passthrough':
+        return None
+    return Cassette(transport_config.get('cassette', 'cassettes/run.jsonl.gz'), mode=mode,
+                    realtime=transport_config.get('realtime', False), overwrite=transport_config.get('overwrite', False))
+
+def create_model(config, cache=None, retry_policy=None, concurrency=None):
+    return SiliconFlowModel(
+        api_key=config['siliconflow']['api_key'],
+        model=config['siliconflow'].get('model'),
+        base_url=config['siliconflow'].get('base_url'),
+        rpm=config['siliconflow'].get('rpm', 1000),
+        tpm=config['siliconflow'].get('tpm', 20000),
+        stream=config['siliconflow'].get('stream', False),
+        request_timeout=config['siliconflow'].get('request_timeout', 30),
+        structured_output=config['siliconflow'].get('structured_output', False),
+        context_window=config['siliconflow'].get('context_window', 32768),
+        cache=cache,
+        retry_policy=retry_policy,
+        concurrency=concurrency,
+        transport=create_transport(config)
+    )
+
+def create_work_queue(config, dataset, concurrency=None):
+    """创建跨文档共享的工作队列，数据集条目可选填写 weight、priority 和 deadline"""
+    work_queue = WorkQueue(config.get('evaluation', {}).get('max_concurrency', 10), concurrency)
+    for item_key, item_data in dataset.items():
+        work_queue.register(item_key, weight=item_data.get('weight', 1.0), priority=item_data.get('priority', 0),
+                            deadline=item_data.get('deadline'))
+    return work_queue
+
+async def report_progress(work_queue, interval, metrics_path=None):
+    """定期输出每个项目的进度和预计剩余时间，并刷新 Prometheus 指标文件"""
+    while True:
+        await asyncio.sleep(interval)
+        print(f"评估进度：\n{work_queue.progress_summary()}")
+        if metrics_path:
+            metrics.write_textfile(metrics_path)
+
+def setup_tracing(config):
+    """按配置开启时间线追踪，返回追踪文件路径；未开启时返回None"""
+    tracing_config = config.get('tracing', {})
+    if not tracing_config.get('enabled', False):
+        return None
+    tracer.enable(tracing_config.get('max_events', 1000000))
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(tracing_config.get('dir', 'traces'), f"trace_{timestamp}_{os.getpid()}.json")
+
+def create_job_store(config, path=None):
+    distributed_config = config.get('distributed', {})
+    return JobStore(path or distributed_config.get('store', 'jobs/jobs.sqlite3'),
+                    max_attempts=distributed_config.get('max_attempts', 3))
+
+def get_checkpoint_path(file_path, checkpoint_dir="checkpoints"):
+    """每个文档独立的检查点日志路径"""
+    base_filename = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(checkpoint_dir, f"{base_filename}.jsonl")
 
 def get_result_file_path(file_path):
     base_filename = os.path.splitext(os.path.basename(file_path))[0]
-    result_file_pattern = f"evaluation_{base_filename}_*.json"
-    result_files = [f for f in os.listdir('evaluation_results') if f.startswith(f"evaluation_{base_filename}_") and f.endswith('.json')]
-    return os.path.join('evaluation_results', result_files[0]) if result_files else None
+    result_files = sorted(f for f in os.listdir('evaluation_results') if f.startswith(f"evaluation_{base_filename}_") and f.endswith('.json'))
+    # 文件名以时间戳结尾，取最新的一次评估结果
+    return os.path.join('evaluation_results', result_files[-1]) if result_files else None
+
+def analyze_result(item_key, topic, result_file_path):
+    result_folder = os.path.join('result', topic)
+    
+    if not os.path.exists(result_folder):
+        # 如果结果文件夹不存在，执行分析
+        print(f"执行分析：{item_key}")
+        analyzer = ResultAnalyzer(result_file_path)
+        analyzer.analyze()
+    else:
+        print(f"跳过 {item_key}：结果文件夹已存在")
 
-async def process_item(item_key, item_data, config):
+async def process_item(item_key, item_data, config, model, work_queue=None):
     topic = item_data['topic']
     file_path = item_data['file_path']
     description = item_data['description']
+    evaluation_config = config.get('evaluation', {})
     
     # 检查评估结果文件是否存在
-    result_file_name = f"evaluation_{os.path.splitext(os.path.basename(file_path))[0]}_*.json"
-    result_files = [f for f in os.listdir('evaluation_results') if f.startswith(f"evaluation_{os.path.splitext(os.path.basename(file_path))[0]}_") and f.endswith('.json')]
+    result_file_path = get_result_file_path(file_path)
     
-    if result_files:
-        result_file_path = os.path.join('evaluation_results', result_files[0])
-        result_folder = os.path.join('result', topic)
-        
-        if not os.path.exists(result_folder):
-            # 如果结果文件夹不存在，执行分析
-            print(f"执行分析：{item_key}")
-            analyzer = ResultAnalyzer(result_file_path)
-            analyzer.analyze()
-        else:
-            print(f"跳过 {item_key}：结果文件夹已存在")
+    if result_file_path and not evaluation_config.get('incremental', False):
+        analyze_result(item_key, topic, result_file_path)
+        return
+    
+    if result_file_path:
+        # 增量模式：只重新评估相对上次结果发生变化的部分
+        print(f"进行增量评估：{item_key}")
+        previous_results = PreviousResults.from_file(result_file_path, AIEvaluator._coherence_pairs)
     else:
         # 如果评估结果文件不存在，进行评估
         print(f"进行评估：{item_key}")
-        # 这里放置评估的代码
-        # 使用TextProcessor读取和处理长文本文件
-        text_processor = TextProcessor(file_path)
-        processed_sections = text_processor.process()
-        
-        # 创建模型实例
-        model = SiliconFlowModel(
-            api_key=config['siliconflow']['api_key'],
-            model=config['siliconflow'].get('model'),
-            base_url=config['siliconflow'].get('base_url')
-        )
-
-        # 创建评估器
-        expected_style = "遵循特定人工智能领域的规范，保持准确性、客观性、一致性和清晰性，具备良好的组织结构，并在写作前深入思考核心内容和表达方式。"
-        evaluator = AIEvaluator(model=model, topic=topic, topic_description=description, expected_style=expected_style)
-        
-        # 进行评估
-        evaluated_sections = await evaluator.evaluate_document(processed_sections)
-        evaluator.save_results(evaluated_sections, file_path)
-
-        # 保存评估结果
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        base_filename = os.path.splitext(os.path.basename(file_path))[0]
-        result_file_name = f"evaluation_{base_filename}_{timestamp}.json"
-        result_file_path = os.path.join('evaluation_results', result_file_name)
-        
-        
-        print(f"评估完成：{item_key}。结果保存至 {result_file_path}")
+        previous_results = None
+    
+    # 创建评估器
+    evaluator = AIEvaluator(model=model, topic=topic, topic_description=description, expected_style=EXPECTED_STYLE,
+                            max_concurrency=evaluation_config.get('max_concurrency', 10),
+                            combined_criteria=evaluation_config.get('combined_criteria', False),
+                            checkpoint_file=get_checkpoint_path(file_path, evaluation_config.get('checkpoint_dir', 'checkpoints')),
+                            work_queue=work_queue, item_key=item_key)
+    
+    text_processor = TextProcessor(file_path)
+    if previous_results is not None:
+        # 增量模式先比对内存映射文档的段落摘要，与上次结果完全一致时不再建立评估单元
+        digests = await asyncio.to_thread(text_processor.section_digests)
+        if digests is not None and previous_results.unchanged(digests, evaluator.criteria):
+            print(f"跳过 {item_key}：文档内容未发生变化")
+            evaluator.clear_checkpoint()
+            analyze_result(item_key, topic, result_file_path)
+            return
+    
+    # 边读取边评估：每解析完一个章节就开始评估该章节
+    evaluated_sections = await evaluator.evaluate_document(text_processor.iter_sections(), previous_results)
+    print(f"解析统计：{item_key} {evaluator.parser.stats_summary()}")
+    
+    if previous_results is not None and evaluator.evaluated_units == 0 and len(evaluated_sections) == previous_results.section_count:
+        print(f"跳过 {item_key}：文档内容未发生变化")
+        evaluator.clear_checkpoint()
+        analyze_result(item_key, topic, result_file_path)
+        return
+    
+    # 保存评估结果
+    result_file_path = evaluator.save_results(evaluated_sections, file_path)
+    if previous_results is not None:
+        # 评分已更新，重新生成分析报告
+        ResultAnalyzer(result_file_path).analyze()
+    
+    print(f"评估完成：{item_key}。结果保存至 {result_file_path}")
 
 async def main():
     # 加载配置
@@ -84,11 +215,162 @@ async def main():
     # 创建评估结果文件夹
     os.makedirs('evaluation_results', exist_ok=True)
     
+    # 创建响应缓存、重试策略、并发控制器和模型，所有项目共用（重试预算按整次运行计算）
+    cache = create_cache(config)
+    retry_policy = create_retry_policy(config)
+    concurrency = create_concurrency_controller(config)
+    model = create_model(config, cache, retry_policy, concurrency)
+    # 所有项目的模型调用进入同一个工作队列，按优先级和公平份额调度
+    work_queue = create_work_queue(config, dataset, concurrency)
+    trace_path = setup_tracing(config)
+    metrics_path = config.get('metrics', {}).get('textfile', 'metrics/evaluation.prom')
+    reporter = asyncio.create_task(report_progress(work_queue, config.get('evaluation', {}).get('progress_interval', 30), metrics_path))
+    
     # 对每个项目进行评估和分析
-    tasks = [process_item(item_key, item_data, config) for item_key, item_data in dataset.items()]
-    await asyncio.gather(*tasks)
+    tasks = [process_item(item_key, item_data, config, model, work_queue) for item_key, item_data in dataset.items()]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        reporter.cancel()
+        await model.aclose()
+        print(f"重试统计：{retry_policy.stats()}")
+        print(f"并发控制统计：{concurrency.stats()}")
+        print(f"令牌计数缓存：{TokenCounter.shared().stats()}")
+        print(f"令牌用量：{model.usage_stats()}")
+        if model.transport is not None:
+            print(f"请求磁带：{model.transport.stats()}")
+        metrics.write_textfile(config.get('metrics', {}).get('textfile', 'metrics/evaluation.prom'))
+        if trace_path:
+            tracer.save(trace_path)
+        if cache is not None:
+            print(f"响应缓存统计：{cache.stats()}")
+            cache.close()
+
+def item_settings(config, item_data):
+    """分布式模式下创建 AIEvaluator 所需的参数"""
+    return {
+        "topic": item_data['topic'],
+        "topic_description": item_data['description'],
+        "expected_style": EXPECTED_STYLE,
+        "combined_criteria": config.get('evaluation', {}).get('combined_criteria', False)
+    }
+
+async def worker_main(args):
+    config = load_config()
+    if args.api_key:
+        # 不同工作进程可以使用不同的API密钥，各自拥有独立的限流配额
+        config['siliconflow']['api_key'] = args.api_key
+    distributed_config = config.get('distributed', {})
+    evaluation_config = config.get('evaluation', {})
+    store = create_job_store(config, args.store)
+    cache = create_cache(config)
+    retry_policy = create_retry_policy(config)
+    concurrency = create_concurrency_controller(config)
+    model = create_model(config, cache, retry_policy, concurrency)
+    trace_path = setup_tracing(config)
+    try:
+        await run_worker(store, model, args.worker_id or f"{socket.gethostname()}-{os.getpid()}",
+                         lambda file_path: get_checkpoint_path(file_path, evaluation_config.get('checkpoint_dir', 'checkpoints')),
+                         max_concurrency=evaluation_config.get('max_concurrency', 10),
+                         lease_seconds=distributed_config.get('lease_seconds', 120),
+                         poll_interval=distributed_config.get('poll_interval', 5))
+    finally:
+        await model.aclose()
+        store.close()
+        print(f"重试统计：{retry_policy.stats()}")
+        print(f"并发控制统计：{concurrency.stats()}")
+        print(f"令牌计数缓存：{TokenCounter.shared().stats()}")
+        print(f"令牌用量：{model.usage_stats()}")
+        if model.transport is not None:
+            print(f"请求磁带：{model.transport.stats()}")
+        metrics.write_textfile(config.get('metrics', {}).get('textfile', 'metrics/evaluation.prom'))
+        if trace_path:
+            tracer.save(trace_path)
+        if cache is not None:
+            print(f"响应缓存统计：{cache.stats()}")
+            cache.close()
+
+def submit_main(args):
+    config = load_config()
+    dataset = load_dataset('dataset.json')
+    store = create_job_store(config, args.store)
+    submit_items(store, dataset, lambda item_data: item_settings(config, item_data), create_model(config))
+    print(f"任务库状态：{store.stats()}")
+    store.close()
+
+def merge_main(args):
+    config = load_config()
+    dataset = load_dataset('dataset.json')
+    store = create_job_store(config, args.store)
+    os.makedirs('evaluation_results', exist_ok=True)
+    evaluation_config = config.get('evaluation', {})
+    merged = merge_results(store, lambda file_path: get_checkpoint_path(file_path, evaluation_config.get('checkpoint_dir', 'checkpoints')))
+    for item_key, result_file_path in merged:
+        if item_key in dataset:
+            analyze_result(item_key, dataset[item_key]['topic'], result_file_path)
+    print(f"已合并 {len(merged)} 个项目，任务库状态：{store.stats()}")
+    store.close()
+
+async def batch_main(args):
+    """批量模式：通过服务商的 Batch API 评估整个数据集，中断后重新运行会从已提交的批次继续"""
+    config = load_config()
+    dataset = load_dataset('dataset.json')
+    batch_config = config.get('batch', {})
+    os.makedirs('evaluation_results', exist_ok=True)
+    # 与普通运行一样，已有评估结果的项目只重新分析，不再提交
+    pending = {}
+    for item_key, item_data in dataset.items():
+        result_file_path = get_result_file_path(item_data['file_path'])
+        if result_file_path:
+            analyze_result(item_key, item_data['topic'], result_file_path)
+        else:
+            pending[item_key] = item_data
+    if not pending:
+        print("所有项目均已有评估结果")
+        return
+    retry_policy = create_retry_policy(config)
+    model = create_model(config, retry_policy=retry_policy)
+    # 默认使用与 chat/completions 相同的API根地址
+    base_url = batch_config.get('base_url') or model.base_url.rsplit('/chat/completions', 1)[0]
+    client = BatchClient(batch_config.get('api_key') or config['siliconflow']['api_key'], base_url, retry_policy=retry_policy)
+    state = BatchState(batch_config.get('dir', 'batches'))
+    items, requests = plan_items(model, pending, lambda item_data: item_settings(config, item_data))
+    print(f"共 {len(requests)} 个请求，已取回 {sum(1 for custom_id in requests if custom_id in state.results)} 个结果")
+    try:
+        await run_batches(client, requests, state,
+                          poll_interval=batch_config.get('poll_interval', 30),
+                          completion_window=batch_config.get('completion_window', '24h'),
+                          max_rounds=batch_config.get('max_rounds', 3))
+        saved = await assemble_items(items, requests, state, model)
+    finally:
+        await client.aclose()
+        await model.aclose()
+    state.clear()
+    for item_key, result_file_path in saved:
+        analyze_result(item_key, dataset[item_key]['topic'], result_file_path)
+    print(f"令牌用量：{model.usage_stats()}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="长文本评估")
+    parser.add_argument('mode', nargs='?', default='run', choices=['run', 'submit', 'worker', 'merge', 'batch'],
+                        help="run: 单进程评估；submit: 把评估单元写入任务库；worker: 领取并执行任务；merge: 合并已完成的项目；"
+                             "batch: 通过 Batch API 批量评估")
+    parser.add_argument('--store', help="任务库路径，默认取 config.json 中 distributed.store")
+    parser.add_argument('--worker-id', help="工作进程标识，默认为 主机名-进程号")
+    parser.add_argument('--api-key', help="工作进程使用的API密钥，覆盖 config.json 中的配置")
+    return parser.parse_args()
 
 if __name__ == "__main__":
+    args = parse_args()
     if sys.platform.startswith('win'):
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    asyncio.run(main())
+    if args.mode == 'submit':
+        submit_main(args)
+    elif args.mode == 'worker':
+        asyncio.run(worker_main(args))
+    elif args.mode == 'merge':
+        merge_main(args)
+    elif args.mode == 'batch':
+        asyncio.run(batch_main(args))
+    else:
+        asyncio.run(main())
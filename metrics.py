@@ -0,0 +1,199 @@
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 当前上下文的指标标签（项目、评分标准等），随 asyncio 任务传递到模型调用内部
+_context_labels = contextvars.ContextVar('metric_labels', default={})
+
+
+@contextmanager
+def metric_labels(**labels):
+    """在上下文中附加指标标签，期间记录的所有指标都带上这些标签"""
+    token = _context_labels.set({**_context_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _context_labels.reset(token)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """按桶边界线性插值估计分位数"""
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if cumulative + count >= target and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (target - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """
+    进程内的指标注册表：计数器和直方图，按标签区分序列
+    可导出为 Prometheus 文本文件格式和JSON摘要
+    """
+
+    # 延迟类直方图的桶边界（秒）
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+    PREFIX = "evaluator_"
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _series(labels):
+        merged = {**_context_labels.get(), **labels}
+        return tuple(sorted((key, str(value)) for key, value in merged.items() if value is not None))
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = self._series(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, buckets=None, **labels):
+        key = self._series(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(buckets or self.DEFAULT_BUCKETS)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """记录代码块耗时"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start, **labels)
+
+    @staticmethod
+    def _format_labels(key, extra=()):
+        pairs = list(key) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full_name = self.PREFIX + name
+                if name in self._help:
+                    lines.append(f"# HELP {full_name} {self._help[name]}")
+                lines.append(f"# TYPE {full_name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{full_name}{self._format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                full_name = self.PREFIX + name
+                if name in self._help:
+                    lines.append(f"# HELP {full_name} {self._help[name]}")
+                lines.append(f"# TYPE {full_name} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                        cumulative += count
+                        lines.append(f"{full_name}_bucket{self._format_labels(key, [('le', str(bound))])} {cumulative}")
+                    lines.append(f"{full_name}_sum{self._format_labels(key)} {histogram.sum}")
+                    lines.append(f"{full_name}_count{self._format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """写入 Prometheus node_exporter 文本文件，先写临时文件再替换，避免被读到一半"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(temp_path, path)
+
+    def summary(self, **match):
+        """
+        JSON摘要：计数器按标签列出，直方图给出次数、均值和 p50/p90/p99
+        match 指定的标签用于筛选序列（例如只看某个项目）
+        """
+        wanted = {key: str(value) for key, value in match.items()}
+
+        def matches(key):
+            labels = dict(key)
+            return all(labels.get(name) == value for name, value in wanted.items())
+
+        result = {"counters": {}, "histograms": {}}
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                items = [{"labels": dict(key), "value": value} for key, value in sorted(series.items()) if matches(key)]
+                if items:
+                    result["counters"][name] = items
+            for name, series in sorted(self._histograms.items()):
+                items = []
+                for key, histogram in sorted(series.items()):
+                    if not matches(key):
+                        continue
+                    items.append({
+                        "labels": dict(key),
+                        "count": histogram.count,
+                        "sum": round(histogram.sum, 4),
+                        "mean": round(histogram.sum / histogram.count, 4) if histogram.count else None,
+                        "p50": _round(histogram.quantile(0.5)),
+                        "p90": _round(histogram.quantile(0.9)),
+                        "p99": _round(histogram.quantile(0.99))
+                    })
+                if items:
+                    result["histograms"][name] = items
+        return result
+
+    def write_summary(self, path, **match):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(**match), f, ensure_ascii=False, indent=2)
+
+
+def _round(value):
+    return round(value, 4) if value is not None else None
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# 进程内共享的指标注册表
+metrics = MetricsRegistry()
+metrics.describe("queue_wait_seconds", "模型调用在各排队阶段的等待时间（stage: work_queue、semaphore、rate_limiter、concurrency）")
+metrics.describe("time_to_first_byte_seconds", "发出请求到收到响应头的时间")
+metrics.describe("request_latency_seconds", "单次HTTP请求的总耗时")
+metrics.describe("http_responses_total", "按状态类别统计的HTTP响应和网络错误数")
+metrics.describe("prompt_tokens_total", "输入令牌数")
+metrics.describe("completion_tokens_total", "输出令牌数")
+metrics.describe("cached_tokens_total", "命中服务端前缀缓存的输入令牌数")
+metrics.describe("retries_total", "按错误类别统计的重试次数")
+metrics.describe("parse_outcomes_total", "响应解析路径的命中次数")
+metrics.describe("ai_assisted_parse_seconds", "AI辅助解析往返耗时")
+metrics.describe("response_cache_total", "响应缓存命中和未命中次数")
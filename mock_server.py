@@ -0,0 +1,291 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+from aiohttp import web
+from model.tokens import TokenCounter
+
+# 提示词输出格式中的评分标准名称，如 "语言流畅度和表达":{"score": 评分, ...}
+_CRITERION_PATTERN = re.compile(r'"([^"{}]+)":\s*\{\s*"score"')
+# 要求直接输出 {"score", "explanation"} 的提示词（AI辅助解析）：格式中的 {"score" 前面不是JSON键的冒号
+_FLAT_FORMAT_PATTERN = re.compile(r'(?:^|[^:\s])\s*\{\s*"score"')
+
+
+class MockChatServer:
+    """
+    本地模拟的 OpenAI 兼容 /chat/completions 服务，用于基准测试和离线调试
+    可配置响应延迟分布、429/5xx 错误注入、格式错误的JSON比例和流式输出
+    评分结果按提示词中的输出格式生成，单项评估和合并评估都能正常解析
+    同时提供 /files 和 /batches 接口，作为 Batch API 的本地替身：
+    批次中的请求按 batch_interval 逐个处理，5xx 比例同样作用于每个请求；
+    设置 batch_expire_after 时批次处理到该数量的请求后过期，用于测试部分完成后的续跑
+    """
+
+    def __init__(self, latency="lognormal", latency_mean=0.5, latency_sigma=0.5, rate_429=0.0, rate_5xx=0.0,
+                 malformed_rate=0.0, stream_chunks=8, stream_interval=0.01, retry_after=0, seed=None,
+                 batch_interval=0.0, batch_expire_after=None):
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.latency_sigma = latency_sigma
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.malformed_rate = malformed_rate
+        self.stream_chunks = stream_chunks
+        self.stream_interval = stream_interval
+        self.retry_after = retry_after
+        self.batch_interval = batch_interval
+        self.batch_expire_after = batch_expire_after
+        self.random = random.Random(seed)
+        self.tokens = TokenCounter.shared()
+        self.stats = {"requests": 0, "responses": 0, "streamed": 0, "status_429": 0, "status_5xx": 0, "malformed": 0,
+                      "prompt_tokens": 0, "completion_tokens": 0}
+        self.files = {}
+        self.batches = {}
+        self._batch_tasks = set()
+        self._runner = None
+
+    def sample_latency(self):
+        """按配置的分布抽取一次响应延迟（秒）"""
+        mean = self.latency_mean
+        if mean <= 0:
+            return 0.0
+        if self.latency == "fixed":
+            return mean
+        if self.latency == "uniform":
+            return self.random.uniform(0, 2 * mean)
+        if self.latency == "exponential":
+            return self.random.expovariate(1 / mean)
+        # 对数正态分布：取 mu 使期望等于 latency_mean，sigma 越大长尾越重
+        mu = math.log(mean) - self.latency_sigma ** 2 / 2
+        return self.random.lognormvariate(mu, self.latency_sigma)
+
+    def make_content(self, prompt):
+        if _FLAT_FORMAT_PATTERN.search(prompt):
+            # AI辅助解析读取的是不带 reasoning/result 包装的单项评分
+            content = json.dumps(self._score(), ensure_ascii=False)
+        else:
+            criteria = [name for name in _CRITERION_PATTERN.findall(prompt) if name != "result"]
+            if criteria:
+                result = {criterion: self._score() for criterion in criteria}
+            else:
+                result = self._score()
+            content = json.dumps({"reasoning": "模拟评估过程", "result": result}, ensure_ascii=False)
+        if self.random.random() < self.malformed_rate:
+            self.stats["malformed"] += 1
+            content = self._malform(content)
+        return content
+
+    def _score(self):
+        return {"score": self.random.randint(1, 5), "explanation": "模拟评分"}
+
+    def _malform(self, content):
+        """生成常见的不规范输出：代码块包裹、前后带说明文字、缺少结尾括号或无法解析的文本"""
+        kind = self.random.choice(("fenced", "prose", "truncated", "garbage"))
+        if kind == "fenced":
+            return f"```json\n{content}\n```"
+        if kind == "prose":
+            return f"评估结果如下：\n{content}\n以上是我的评估。"
+        if kind == "truncated":
+            return content[:-1]
+        return "抱歉，我无法按要求的格式输出评分。"
+
+    def _usage(self, prompt_tokens, content):
+        completion_tokens = self.tokens.count(content)
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["completion_tokens"] += completion_tokens
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    async def handle_chat(self, request):
+        self.stats["requests"] += 1
+        body = await request.json()
+        await asyncio.sleep(self.sample_latency())
+        draw = self.random.random()
+        if draw < self.rate_429:
+            self.stats["status_429"] += 1
+            return web.json_response({"error": {"message": "rate limit exceeded"}}, status=429,
+                                     headers={"Retry-After": str(self.retry_after)})
+        if draw < self.rate_429 + self.rate_5xx:
+            self.stats["status_5xx"] += 1
+            return web.json_response({"error": {"message": "upstream error"}}, status=self.random.choice((500, 502, 503)))
+
+        completion = self.complete(body)
+        if body.get('stream'):
+            return await self._stream(request, body, completion["choices"][0]["message"]["content"], completion["usage"])
+        return web.json_response(completion)
+
+    def complete(self, body):
+        """生成一次 chat/completions 的响应体"""
+        messages = body.get('messages') or []
+        prompt = messages[-1]['content'] if messages else ""
+        prompt_tokens = sum(self.tokens.count_prompt(message.get('content') or "") for message in messages)
+        content = self.make_content(prompt)
+        self.stats["responses"] += 1
+        return {
+            "id": f"chatcmpl-mock-{self.stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get('model'),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": self._usage(prompt_tokens, content)
+        }
+
+    async def _stream(self, request, body, content, usage):
+        """按SSE格式分块输出，最后一块附带 usage"""
+        self.stats["streamed"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        size = max(1, math.ceil(len(content) / max(1, self.stream_chunks)))
+        try:
+            for start in range(0, len(content), size):
+                chunk = {"choices": [{"index": 0, "delta": {"content": content[start:start + size]}}], "model": body.get('model')}
+                await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                await asyncio.sleep(self.stream_interval)
+            await response.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode('utf-8'))
+            await response.write(b"data: [DONE]\n\n")
+        except ConnectionResetError:
+            # 客户端读到完整的result后会提前断开连接
+            pass
+        return response
+
+    async def handle_upload(self, request):
+        form = await request.post()
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        self.files[file_id] = form['file'].file.read()
+        return web.json_response({"id": file_id, "object": "file", "bytes": len(self.files[file_id]),
+                                  "purpose": form.get('purpose'), "created_at": int(time.time())})
+
+    async def handle_file_content(self, request):
+        content = self.files.get(request.match_info['file_id'])
+        if content is None:
+            return web.json_response({"error": {"message": "file not found"}}, status=404)
+        return web.Response(body=content, content_type="application/jsonl")
+
+    async def handle_create_batch(self, request):
+        body = await request.json()
+        if body.get('input_file_id') not in self.files:
+            return web.json_response({"error": {"message": "input file not found"}}, status=400)
+        batch_id = f"batch-{uuid.uuid4().hex[:12]}"
+        self.batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": body.get('endpoint'), "input_file_id": body['input_file_id'],
+            "completion_window": body.get('completion_window'), "status": "validating", "created_at": int(time.time()),
+            "output_file_id": None, "error_file_id": None, "request_counts": {"total": 0, "completed": 0, "failed": 0}
+        }
+        task = asyncio.create_task(self._process_batch(self.batches[batch_id]))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+        return web.json_response(self.batches[batch_id])
+
+    async def handle_get_batch(self, request):
+        batch = self.batches.get(request.match_info['batch_id'])
+        if batch is None:
+            return web.json_response({"error": {"message": "batch not found"}}, status=404)
+        return web.json_response(batch)
+
+    async def _process_batch(self, batch):
+        lines = [json.loads(line) for line in self.files[batch['input_file_id']].decode('utf-8').splitlines() if line.strip()]
+        counts = batch['request_counts']
+        counts['total'] = len(lines)
+        batch['status'] = "in_progress"
+        outputs, errors = [], []
+        for index, line in enumerate(lines):
+            if self.batch_expire_after is not None and index >= self.batch_expire_after:
+                batch['status'] = "expired"
+                break
+            await asyncio.sleep(self.batch_interval)
+            self.stats["requests"] += 1
+            entry = {"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": line['custom_id']}
+            if self.random.random() < self.rate_5xx:
+                self.stats["status_5xx"] += 1
+                counts['failed'] += 1
+                errors.append({**entry, "response": {"status_code": 500, "body": {"error": {"message": "upstream error"}}}, "error": None})
+                continue
+            counts['completed'] += 1
+            outputs.append({**entry, "response": {"status_code": 200, "body": self.complete(line['body'])}, "error": None})
+        if batch['status'] != "expired":
+            batch['status'] = "finalizing"
+        for key, entries in (("output_file_id", outputs), ("error_file_id", errors)):
+            if entries:
+                file_id = f"file-{uuid.uuid4().hex[:12]}"
+                self.files[file_id] = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode('utf-8')
+                batch[key] = file_id
+        if batch['status'] != "expired":
+            batch['status'] = "completed"
+
+    async def handle_stats(self, request):
+        return web.json_response(self.stats)
+
+    def create_app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/v1/chat/completions', self.handle_chat)
+        app.router.add_post('/chat/completions', self.handle_chat)
+        app.router.add_post('/v1/files', self.handle_upload)
+        app.router.add_get('/v1/files/{file_id}/content', self.handle_file_content)
+        app.router.add_post('/v1/batches', self.handle_create_batch)
+        app.router.add_get('/v1/batches/{batch_id}', self.handle_get_batch)
+        app.router.add_get('/stats', self.handle_stats)
+        return app
+
+    async def start(self, host="127.0.0.1", port=8000):
+        """启动服务并返回API根地址（OpenAIModel 的 base_url，其后加 /chat/completions 即为 SiliconFlowModel 的地址）"""
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f"http://{host}:{port}/v1"
+
+    async def stop(self):
+        for task in list(self._batch_tasks):
+            task.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def add_server_arguments(parser):
+    """模拟服务的命令行参数，mock_server.py 和 benchmark.py 共用"""
+    parser.add_argument('--latency', choices=["fixed", "uniform", "exponential", "lognormal"], default="lognormal", help="响应延迟分布")
+    parser.add_argument('--latency-mean', type=float, default=0.5, help="平均响应延迟（秒）")
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help="对数正态分布的 sigma，越大长尾越重")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="返回429的请求比例")
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help="返回5xx的请求比例")
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help="返回格式错误JSON的比例")
+    parser.add_argument('--stream-chunks', type=int, default=8, help="流式输出的分块数")
+    parser.add_argument('--stream-interval', type=float, default=0.01, help="流式输出两个分块之间的间隔（秒）")
+    parser.add_argument('--retry-after', type=float, default=0, help="429响应的 Retry-After（秒）")
+    parser.add_argument('--seed', type=int, default=None, help="随机种子，固定后注入的延迟和错误可复现")
+    parser.add_argument('--batch-interval', type=float, default=0.0, help="批次中每个请求的处理时间（秒）")
+    parser.add_argument('--batch-expire-after', type=int, default=None, help="批次处理到该数量的请求后过期")
+
+
+def server_from_args(args):
+    return MockChatServer(latency=args.latency, latency_mean=args.latency_mean, latency_sigma=args.latency_sigma,
+                          rate_429=args.rate_429, rate_5xx=args.rate_5xx, malformed_rate=args.malformed_rate,
+                          stream_chunks=args.stream_chunks, stream_interval=args.stream_interval,
+                          retry_after=args.retry_after, seed=args.seed, batch_interval=args.batch_interval,
+                          batch_expire_after=args.batch_expire_after)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地模拟的 OpenAI 兼容 chat/completions 服务")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8000)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    async def serve():
+        server = server_from_args(args)
+        url = await server.start(args.host, args.port)
+        print(f"模拟服务已启动: {url}/chat/completions（统计信息: http://{args.host}:{args.port}/stats）")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
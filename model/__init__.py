@@ -1,3 +1,7 @@
 from .openai_model import OpenAIModel
 from .siliconflow_model import SiliconFlowModel
-
+from .cache import ResponseCache
+from .retry import RetryPolicy, RetryBudget, ProviderError
+from .rate_limiter import RateLimiter
+from .concurrency import AdaptiveConcurrencyController
+from .transport import Cassette, CassetteMiss
@@ -1,12 +1,284 @@
 from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+import json
+import time
+import aiohttp
+from myparser import IncrementalResultScanner
+from metrics import metrics
+from tracing import tracer
+from .retry import RetryPolicy, ProviderError, classify_error, parse_retry_after
+from .concurrency import AdaptiveConcurrencyController
+from .rate_limiter import RateLimiter
+from .tokens import TokenCounter
 
 class BaseModel(ABC):
+    # 服务商名称，用于区分缓存键
+    provider = None
+    system_prompt = "你是一个专业的文本评估助手。"
+    # 服务商支持的结构化输出方式："json_object" 和/或 "json_schema"
+    structured_output_modes = ()
+
     @abstractmethod
-    def __init__(self, api_key, model=None, base_url=None):
+    def __init__(self, api_key, model=None, base_url=None, cache=None, retry_policy=None, concurrency=None,
+                 stream=False, request_timeout=30, structured_output=False, context_window=32768, transport=None,
+                 rpm=1000, tpm=20000):
         self.api_key = api_key
         self.model = model
         self.base_url = base_url
+        # 可选的 ResponseCache，所有模型实现共用同一套缓存逻辑
+        self.cache = cache
+        # 自适应并发控制器，可由多个模型实例共享；连接池大小取其窗口上限
+        self.concurrency = concurrency or AdaptiveConcurrencyController()
+        # 流式模式：结果JSON闭合后立即结束读取；超时时间按两个数据块之间的间隔计算
+        self.stream = stream
+        self.request_timeout = request_timeout
+        # 结构化输出：按服务商能力请求JSON对象或JSON Schema约束的输出
+        self.structured_output = structured_output and bool(self.structured_output_modes)
+        if self.structured_output:
+            # 部分服务商要求消息中明确提到JSON才允许开启JSON模式
+            self.system_prompt = self.system_prompt + "请始终以JSON格式输出。"
+        # 模型上下文窗口（令牌数），评估器据此拆分超长段落
+        self.context_window = context_window
+        # 进程内共享的令牌计数缓存
+        self.tokens = TokenCounter.shared()
+        # 本次运行的令牌用量，cached_tokens 为命中服务端提示词前缀缓存的输入令牌数
+        self.usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+        # 会话在首次请求时创建并在整个生命周期内复用
+        self._session = None
+        # 重试策略，可由多个模型实例共享以使用同一份重试预算
+        self.retry_policy = retry_policy or RetryPolicy()
+        # 可选的录制/回放磁带（model.transport.Cassette），为None时直接访问网络
+        self.transport = transport
+        # 每分钟请求数和令牌数配额，限流器在首次请求时按API密钥和模型取得
+        self.rpm = rpm
+        self.tpm = tpm
+        self._rate_limiter = None
+
+    @property
+    def rate_limiter(self):
+        """同一API密钥和模型的所有实例（不论服务商实现）共用一个限流器"""
+        if self._rate_limiter is None:
+            self._rate_limiter = RateLimiter.shared(self.api_key, self.model, rpm=self.rpm, tpm=self.tpm)
+        return self._rate_limiter
+
+    def _get_session(self):
+        """返回共享的HTTP会话，复用连接（keep-alive）并缓存DNS解析结果"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency.max_limit,
+                limit_per_host=self.concurrency.max_limit,
+                ttl_dns_cache=300,
+                keepalive_timeout=60
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    @asynccontextmanager
+    async def _request_slot(self):
+        """
+        在并发控制器的窗口内执行一次HTTP请求，并把延迟和结果反馈给控制器
+        只包住网络请求本身，限流等待不计入延迟
+        """
+        labels = {"provider": self.provider, "model": self.model}
+        with metrics.timer("queue_wait_seconds", stage="concurrency", **labels), tracer.span("concurrency_wait"):
+            await self.concurrency.acquire()
+        start = time.monotonic()
+        outcome = "cancelled"
+        try:
+            yield
+            outcome = "success"
+        except Exception as e:
+            outcome = classify_error(e)[1]
+            if not isinstance(e, ProviderError):
+                # 没有收到HTTP响应的网络错误按错误类别计数
+                metrics.inc("http_responses_total", status_class=outcome, **labels)
+            raise
+        finally:
+            latency = time.monotonic() - start
+            self.concurrency.release(latency, outcome)
+            metrics.observe("request_latency_seconds", latency, **labels)
+
+    def _timeout(self):
+        if self.stream:
+            return aiohttp.ClientTimeout(total=None, sock_read=self.request_timeout)
+        return aiohttp.ClientTimeout(total=self.request_timeout)
+
+    async def _limited_chat(self, url, headers, data, prompt):
+        """在限流器配额内发送一次 chat/completions 请求，完成后用实际用量修正限流器，返回输出文本"""
+        # 按行缓存的令牌计数，模板行和预先计数过的段落不再重复编码
+        with tracer.span("token_count"):
+            tokens = self.tokens.count(self.system_prompt) + self.tokens.count_prompt(prompt)
+        # 回放磁带时不访问服务商，不受限流约束
+        replaying = self.transport is not None and self.transport.replaying
+        if not replaying:
+            with metrics.timer("queue_wait_seconds", stage="rate_limiter", provider=self.provider, model=self.model), tracer.span("limiter_wait"):
+                await self.rate_limiter.wait_for_capacity(tokens)
+
+        content, usage = await self._post_chat(url, headers, data)
+        # 用实际消耗（含输出令牌）修正限流器中按提示词预估的令牌数
+        if not replaying and usage.get('total_tokens') is not None:
+            self.rate_limiter.reconcile(tokens, usage['total_tokens'])
+        return content
+
+    async def _post_chat(self, url, headers, data):
+        """发送一次 chat/completions 请求，返回 (输出文本, usage)；回放模式下从磁带取回结果，不访问网络"""
+        if self.stream:
+            # 要求在流的最后一块返回 usage，限流器和令牌统计依赖实际用量
+            data = {**data, "stream": True, "stream_options": {"include_usage": True}}
+        async with self._request_slot():
+            if self.transport is not None and self.transport.replaying:
+                content, usage = await self.transport.replay(data)
+            else:
+                content, usage = await self._send_chat(url, headers, data)
+        self._record_usage(usage)
+        return content, usage
+
+    async def _send_chat(self, url, headers, data):
+        session = self._get_session()
+        recording = self.transport is not None and self.transport.recording
+        start = time.monotonic()
+        try:
+            async with session.post(url, headers=headers, json=data, timeout=self._timeout()) as response:
+                labels = {"provider": self.provider, "model": self.model}
+                metrics.observe("time_to_first_byte_seconds", time.monotonic() - start, **labels)
+                tracer.record("http_send", start, status=response.status)
+                metrics.inc("http_responses_total", status_class=f"{response.status // 100}xx", **labels)
+                if response.status != 200:
+                    raise ProviderError(f"{self.provider} API 调用失败，状态码: {response.status}，响应: {(await response.text())[:500]}",
+                                        status=response.status, retry_after=parse_retry_after(response.headers.get('Retry-After')))
+                with tracer.span("response_receive"):
+                    if self.stream:
+                        content, usage = await self._read_stream(response)
+                        if not usage:
+                            # result 闭合后提前断开时收不到最后一块中的 usage
+                            usage = self._estimate_usage(data, content)
+                    else:
+                        result = await response.json()
+                        content, usage = result['choices'][0]['message']['content'], result.get('usage') or {}
+        except Exception as e:
+            if recording:
+                self.transport.record_error(data, e, time.monotonic() - start)
+            raise
+        if recording:
+            self.transport.record(data, content, usage, time.monotonic() - start)
+        return content, usage
+
+    def _estimate_usage(self, data, content):
+        """按令牌计数器估算一次请求的用量（不含提前断开后未读取的输出）"""
+        prompt_tokens = sum(self.tokens.count_prompt(message['content']) for message in data['messages'])
+        completion_tokens = self.tokens.count(content)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens, "estimated": True}
+
+    def _record_usage(self, usage):
+        self.usage["requests"] += 1
+        self.usage["prompt_tokens"] += usage.get('prompt_tokens') or 0
+        self.usage["completion_tokens"] += usage.get('completion_tokens') or 0
+        # OpenAI兼容接口在 prompt_tokens_details 中返回缓存命中数，部分服务商使用 prompt_cache_hit_tokens
+        details = usage.get('prompt_tokens_details') or {}
+        cached_tokens = details.get('cached_tokens') or usage.get('prompt_cache_hit_tokens') or 0
+        self.usage["cached_tokens"] += cached_tokens
+        labels = {"provider": self.provider, "model": self.model}
+        metrics.inc("prompt_tokens_total", usage.get('prompt_tokens') or 0, **labels)
+        metrics.inc("completion_tokens_total", usage.get('completion_tokens') or 0, **labels)
+        metrics.inc("cached_tokens_total", cached_tokens, **labels)
+
+    def usage_stats(self):
+        prompt_tokens = self.usage["prompt_tokens"]
+        return {
+            **self.usage,
+            "cached_ratio": round(self.usage["cached_tokens"] / prompt_tokens, 3) if prompt_tokens else None
+        }
+
+    async def _read_stream(self, response):
+        """
+        读取SSE流并增量扫描输出，result对象闭合后立即关闭连接，不再等待剩余的推理内容
+        """
+        scanner = IncrementalResultScanner()
+        usage = {}
+        async for line in response.content:
+            line = line.decode('utf-8').strip()
+            if not line.startswith('data:'):
+                continue
+            payload = line[len('data:'):].strip()
+            if payload == '[DONE]':
+                break
+            chunk = json.loads(payload)
+            usage = chunk.get('usage') or usage
+            choices = chunk.get('choices') or []
+            delta = choices[0].get('delta', {}).get('content') if choices else None
+            if delta and scanner.feed(delta):
+                response.close()
+                return scanner.completed_text(), usage
+        return scanner.text, usage
+
+    async def aclose(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self.transport is not None:
+            self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    def _response_format(self, response_schema=None):
+        """根据服务商能力生成 response_format 参数，不支持时返回None"""
+        if not self.structured_output:
+            return None
+        if response_schema is not None and "json_schema" in self.structured_output_modes:
+            return {
+                "type": "json_schema",
+                "json_schema": {"name": "evaluation_result", "strict": True, "schema": response_schema}
+            }
+        if "json_object" in self.structured_output_modes:
+            return {"type": "json_object"}
+        return None
+
+    def _chat_body(self, prompt, response_format=None):
+        """chat/completions 请求体"""
+        data = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": prompt}
+            ]
+        }
+        if response_format is not None:
+            data["response_format"] = response_format
+        return data
+
+    def batch_body(self, prompt, response_schema=None):
+        """Batch API 输入文件中一行请求的 body，与实时调用发送的请求体相同"""
+        return self._chat_body(prompt, self._response_format(response_schema))
+
+    async def get_response(self, prompt, response_schema=None):
+        response_format = self._response_format(response_schema)
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(self.provider, self.model, self.system_prompt, prompt, response_format=response_format)
+            cached = self.cache.get(cache_key)
+            metrics.inc("response_cache_total", result="hit" if cached is not None else "miss", provider=self.provider, model=self.model)
+            if cached is not None:
+                return cached
+
+        try:
+            response = await self.retry_policy.call(self._get_response, prompt, response_format)
+        except Exception as e:
+            print(f"{self.provider} API 调用出错: {type(e).__name__}: {str(e)}")
+            return None
+
+        if cache_key is not None and response is not None:
+            self.cache.set(cache_key, response)
+        return response
 
     @abstractmethod
-    async def get_response(self, prompt):
+    async def _get_response(self, prompt, response_format=None):
+        """
+        发送一次请求并返回模型输出文本
+        失败时抛出异常（非200响应抛出 ProviderError），由重试策略决定是否重试
+        """
         pass
@@ -0,0 +1,69 @@
+import json
+import aiohttp
+from .retry import RetryPolicy, ProviderError, parse_retry_after
+
+
+class BatchClient:
+    """
+    OpenAI 兼容的 Batch API 客户端：上传输入文件、创建批次、查询状态、下载结果文件
+    base_url 为API根地址（如 https://api.siliconflow.cn/v1），各接口的网络错误和5xx按重试策略重试
+    """
+
+    # 批次的终止状态，之后不会再有新的结果
+    TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+    def __init__(self, api_key, base_url, retry_policy=None, request_timeout=300):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.request_timeout = request_timeout
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout)
+            )
+        return self._session
+
+    async def _request(self, method, path, **kwargs):
+        async with self._get_session().request(method, f"{self.base_url}{path}", **kwargs) as response:
+            if response.status != 200:
+                raise ProviderError(f"Batch API 调用失败: {method} {path}，状态码: {response.status}，响应: {(await response.text())[:500]}",
+                                    status=response.status, retry_after=parse_retry_after(response.headers.get('Retry-After')))
+            return await response.read()
+
+    async def _json(self, method, path, **kwargs):
+        return json.loads(await self.retry_policy.call(self._request, method, path, **kwargs))
+
+    async def upload(self, path):
+        """上传批量输入文件，返回文件ID"""
+        async def upload_once():
+            # 每次重试重新打开文件，FormData 不能重复发送
+            with open(path, 'rb') as f:
+                form = aiohttp.FormData()
+                form.add_field("purpose", "batch")
+                form.add_field("file", f, filename=path.replace('\\', '/').rsplit('/', 1)[-1], content_type="application/jsonl")
+                return await self._request("POST", "/files", data=form)
+        return json.loads(await self.retry_policy.call(upload_once))["id"]
+
+    async def create(self, input_file_id, endpoint="/v1/chat/completions", completion_window="24h", metadata=None):
+        body = {"input_file_id": input_file_id, "endpoint": endpoint, "completion_window": completion_window}
+        if metadata:
+            body["metadata"] = metadata
+        return await self._json("POST", "/batches", json=body)
+
+    async def retrieve(self, batch_id):
+        return await self._json("GET", f"/batches/{batch_id}")
+
+    async def download(self, file_id, path):
+        """下载结果文件到 path"""
+        content = await self.retry_policy.call(self._request, "GET", f"/files/{file_id}/content")
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    async def aclose(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
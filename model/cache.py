@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+
+class ResponseCache:
+    """
+    基于SQLite的模型响应缓存
+    以 (服务商, 模型, 系统提示词, 提示词) 的哈希值为键，支持按条目数、总大小和存活时间淘汰
+    """
+
+    # 每写入多少条记录执行一次淘汰
+    EVICT_INTERVAL = 100
+
+    def __init__(self, path="cache/responses.sqlite3", max_entries=None, max_bytes=None, max_age=None, bypass=False):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # 最大存活时间（秒）
+        self.max_age = max_age
+        # 为True时既不读取也不写入缓存
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed)")
+
+    @staticmethod
+    def make_key(provider, model, system_prompt, prompt, **options):
+        payload = json.dumps([provider, model, system_prompt, prompt, options], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        if self.bypass:
+            return None
+        row = self.conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or (self.max_age is not None and now - row[1] > self.max_age):
+            self.misses += 1
+            return None
+        self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return row[0]
+
+    def set(self, key, response):
+        if self.bypass or response is None:
+            return
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, response, len(response.encode('utf-8')), now, now)
+        )
+        self.writes += 1
+        if self.writes % self.EVICT_INTERVAL == 0:
+            self.evict()
+
+    def evict(self):
+        """按存活时间、条目数和总大小淘汰最久未访问的记录"""
+        before = self.conn.total_changes
+        if self.max_age is not None:
+            self.conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,))
+        if self.max_entries is not None:
+            self.conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+        if self.max_bytes is not None:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                keys = []
+                for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC"):
+                    if total <= self.max_bytes:
+                        break
+                    keys.append((key,))
+                    total -= size
+                self.conn.executemany("DELETE FROM responses WHERE key = ?", keys)
+        self.evictions += self.conn.total_changes - before
+
+    def stats(self):
+        entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size
+        }
+
+    def close(self):
+        self.evict()
+        self.conn.close()
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from collections import deque
+
+# 表示服务端过载的结果类别，出现时乘性减小并发窗口
+OVERLOAD_OUTCOMES = {"rate_limited", "timeout", "server_error"}
+
+
+class AdaptiveConcurrencyController:
+    """
+    AIMD（加性增、乘性减）并发控制器
+    延迟稳定且请求成功时逐步放大同时进行的请求数，遇到429、超时或服务端错误时成倍缩小
+    """
+
+    def __init__(self, initial=8, min_limit=1, max_limit=64, decrease_factor=0.5, latency_tolerance=1.5):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        # 短期平均延迟超过长期平均延迟的倍数时停止增大窗口
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.short_latency = None
+        self.long_latency = None
+        self.successes = 0
+        self.failures = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._started = time.monotonic()
+        self._completions = deque()
+        self._waiters = deque()
+
+    @property
+    def window(self):
+        return max(self.min_limit, int(self.limit))
+
+    async def acquire(self):
+        if not self._waiters and self.in_flight < self.window:
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已分配到名额但调用方被取消，交还名额
+                self.in_flight -= 1
+                self._wake()
+            elif future in self._waiters:
+                self._waiters.remove(future)
+            raise
+
+    def release(self, latency, outcome="success"):
+        self.in_flight -= 1
+        self._record(latency, outcome)
+        self._wake()
+
+    def _record(self, latency, outcome):
+        now = time.monotonic()
+        if outcome == "success":
+            self.successes += 1
+            self._completions.append(now)
+            self.short_latency = latency if self.short_latency is None else 0.7 * self.short_latency + 0.3 * latency
+            self.long_latency = latency if self.long_latency is None else 0.98 * self.long_latency + 0.02 * latency
+            if self.short_latency <= self.long_latency * self.latency_tolerance:
+                # 每完成约一个窗口的请求，窗口加一
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        elif outcome in OVERLOAD_OUTCOMES:
+            self.failures += 1
+            # 同一轮过载（一个平均延迟内）只减小一次，避免窗口被连续的失败压到最小
+            if now - self._last_decrease >= (self.short_latency or 1.0):
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self._last_decrease = now
+                self.decreases += 1
+        else:
+            self.failures += 1
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.window:
+            future = self._waiters.popleft()
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def throughput(self, period=60.0):
+        """最近 period 秒内每秒成功完成的请求数"""
+        now = time.monotonic()
+        while self._completions and now - self._completions[0] > period:
+            self._completions.popleft()
+        elapsed = min(period, now - self._started)
+        return len(self._completions) / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        total = self.successes + self.failures
+        return {
+            "window": self.window,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "throughput_per_second": round(self.throughput(), 2),
+            "success_rate": round(self.successes / total, 3) if total else None,
+            "latency_short": round(self.short_latency, 3) if self.short_latency is not None else None,
+            "latency_long": round(self.long_latency, 3) if self.long_latency is not None else None,
+            "decreases": self.decreases
+        }
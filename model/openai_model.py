@@ -7,36 +7,22 @@ import sys
 import json
 
 class OpenAIModel(BaseModel):
-    def __init__(self, api_key, model=None, base_url=None):
-        super().__init__(api_key, model, base_url)
+    provider = "openai"
+    structured_output_modes = ("json_object", "json_schema")
+
+    def __init__(self, api_key, model=None, base_url=None, **options):
+        # options: 缓存、重试、并发控制、流式输出和限流配额（rpm、tpm）等通用配置，见 BaseModel
+        super().__init__(api_key, model, base_url, **options)
         self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
         self.model = model or "gpt-3.5-turbo"
 
-    async def get_response(self, prompt):
+    async def _get_response(self, prompt, response_format=None):
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        data = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": "你是一个专业的文本评估助手。"},
-                {"role": "user", "content": prompt}
-            ]
-        }
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{self.base_url}/chat/completions", headers=headers, json=data) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result['choices'][0]['message']['content']
-                    else:
-                        print(f"API 调用失败，状态码: {response.status}")
-                        print(await response.text())
-                        return None
-        except Exception as e:
-            print(f"API 调用出错: {type(e).__name__}: {str(e)}")
-            return None
+        data = self._chat_body(prompt, response_format)
+        return await self._limited_chat(f"{self.base_url}/chat/completions", headers, data, prompt)
 
 if __name__ == "__main__":
     async def main():
@@ -55,6 +41,7 @@ if __name__ == "__main__":
         
         response = await model.get_response("你好")
         print(response)
+        await model.aclose()
 
     if sys.platform.startswith('win'):
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
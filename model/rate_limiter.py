@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import time
+from collections import deque
+
+
+class RateLimiter:
+    """
+    请求数（RPM）和令牌数（TPM）双令牌桶限流器
+    等待者按先来先服务排队，只在队首请求所需容量恢复的时刻被唤醒，不做轮询
+    """
+
+    # 进程内共享的限流器：(API密钥哈希, 模型) -> RateLimiter
+    _shared = {}
+
+    @classmethod
+    def shared(cls, api_key, model, rpm, tpm):
+        """返回同一API密钥和模型共用的限流器，保证进程内所有客户端共享同一份配额"""
+        key = (hashlib.sha256((api_key or "").encode('utf-8')).hexdigest(), model)
+        limiter = cls._shared.get(key)
+        if limiter is None:
+            limiter = cls._shared[key] = cls(rpm, tpm)
+        return limiter
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.request_tokens = rpm
+        self.token_tokens = tpm
+        self.last_request_time = time.monotonic()
+        self.last_token_time = time.monotonic()
+        self._waiters = deque()
+        self._timer = None
+        self._loop = None
+
+    def _refill(self):
+        current_time = time.monotonic()
+        self.request_tokens = min(self.rpm, self.request_tokens + (current_time - self.last_request_time) * (self.rpm / 60))
+        self.last_request_time = current_time
+        self.token_tokens = min(self.tpm, self.token_tokens + (current_time - self.last_token_time) * (self.tpm / 60))
+        self.last_token_time = current_time
+
+    def _try_acquire(self, tokens):
+        if self.request_tokens >= 1 and self.token_tokens >= tokens:
+            self.request_tokens -= 1
+            self.token_tokens -= tokens
+            return True
+        return False
+
+    async def wait_for_capacity(self, tokens):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 限流器被新的事件循环使用，丢弃上一个循环遗留的等待者和定时器
+            self._loop = loop
+            self._waiters.clear()
+            self._timer = None
+
+        # 单个请求超过桶容量时按桶容量计，否则永远无法获得许可
+        tokens = min(tokens, self.tpm)
+        self._refill()
+        if not self._waiters and self._try_acquire(tokens):
+            return
+
+        future = loop.create_future()
+        self._waiters.append((future, tokens))
+        self._schedule()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已获得许可但调用方被取消，归还配额
+                self.request_tokens += 1
+                self.token_tokens += tokens
+            self._waiters = deque(waiter for waiter in self._waiters if waiter[0] is not future)
+            self._reschedule()
+            raise
+
+    def reconcile(self, estimated_tokens, actual_tokens):
+        """
+        请求完成后按响应 usage 中的实际令牌数（含输出令牌）修正令牌桶
+        实际用量超过预估时令牌桶可以为负，后续请求需等待相应的恢复时间
+        """
+        self._refill()
+        self.token_tokens = min(self.tpm, self.token_tokens - (actual_tokens - min(estimated_tokens, self.tpm)))
+        if actual_tokens < estimated_tokens:
+            self._reschedule()
+
+    def _wake(self):
+        self._timer = None
+        self._refill()
+        while self._waiters:
+            future, tokens = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._try_acquire(tokens):
+                break
+            self._waiters.popleft()
+            future.set_result(None)
+        self._schedule()
+
+    def _schedule(self):
+        """为队首等待者安排在容量恢复的确切时刻唤醒"""
+        if self._timer is not None or not self._waiters:
+            return
+        _, tokens = self._waiters[0]
+        delay = max(
+            (1 - self.request_tokens) / (self.rpm / 60),
+            (tokens - self.token_tokens) / (self.tpm / 60),
+            0
+        )
+        self._timer = self._loop.call_later(delay, self._wake)
+
+    def _reschedule(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._waiters:
+            self._wake()
+
+    def stats(self):
+        self._refill()
+        return {
+            "rpm": self.rpm,
+            "tpm": self.tpm,
+            "available_requests": round(self.request_tokens, 1),
+            "available_tokens": round(self.token_tokens),
+            "waiters": len(self._waiters)
+        }
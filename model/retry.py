@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 可重试的HTTP状态码：限流、请求超时和服务端错误
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class ProviderError(Exception):
+    """模型服务返回的错误响应"""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.status in RETRYABLE_STATUS
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 响应头，支持秒数和HTTP日期两种格式，返回等待秒数"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error):
+    """返回 (是否可重试, 错误类别)"""
+    if isinstance(error, ProviderError):
+        if error.status == 429:
+            return True, "rate_limited"
+        if error.status is not None and error.status >= 500:
+            return True, "server_error"
+        return error.retryable, f"http_{error.status}"
+    if isinstance(error, asyncio.TimeoutError):
+        return True, "timeout"
+    if isinstance(error, (aiohttp.ServerDisconnectedError, aiohttp.ClientPayloadError, ConnectionResetError)):
+        return True, "connection_reset"
+    if isinstance(error, aiohttp.ClientConnectionError):
+        return True, "connection_error"
+    return False, type(error).__name__
+
+
+class RetryBudget:
+    """一次运行中所有模型调用共享的重试次数预算，避免故障时无限重试"""
+
+    def __init__(self, max_retries=None):
+        self.max_retries = max_retries
+        self.used = 0
+
+    def consume(self):
+        if self.max_retries is not None and self.used >= self.max_retries:
+            return False
+        self.used += 1
+        return True
+
+    @property
+    def remaining(self):
+        return None if self.max_retries is None else self.max_retries - self.used
+
+
+class RetryPolicy:
+    """带指数退避、随机抖动和 Retry-After 支持的重试策略"""
+
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=60.0, budget=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self.retries = {}
+        self.budget_exhausted = 0
+
+    def compute_delay(self, attempt, retry_after=None):
+        # 全抖动退避：在 [0, base * 2^attempt] 内随机取值，避免大量请求同时重试
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    async def call(self, func, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                retryable, category = classify_error(e)
+                attempt += 1
+                if not retryable or attempt >= self.max_attempts:
+                    raise
+                if not self.budget.consume():
+                    self.budget_exhausted += 1
+                    logger.warning(f"重试预算已用尽，放弃重试: {category}")
+                    raise
+                self.retries[category] = self.retries.get(category, 0) + 1
+                metrics.inc("retries_total", category=category)
+                delay = self.compute_delay(attempt - 1, getattr(e, 'retry_after', None))
+                logger.warning(f"模型调用失败（{category}），{delay:.1f} 秒后进行第 {attempt} 次重试")
+                await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            "retries": dict(self.retries),
+            "budget_used": self.budget.used,
+            "budget_remaining": self.budget.remaining,
+            "budget_exhausted": self.budget_exhausted
+        }
@@ -0,0 +1,152 @@
+import bisect
+import asyncio
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import tiktoken
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+# 句末标点，拆分超长段落时优先在这些位置断开
+SENTENCE_END = re.compile(r'(?<=[。！？；!?;.])')
+
+
+def get_encoder():
+    """进程内共享的编码器，只在首次使用时加载"""
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder = tiktoken.encoding_for_model("gpt-3.5-turbo")
+    return _encoder
+
+
+class TokenCounter:
+    """
+    带缓存的令牌计数
+    提示词按行计数并缓存每一行的结果：评分标准等模板行在所有提示词中重复出现，
+    段落在 TextProcessor 中已合并为单行，预先批量计数后热路径上只有哈希查找
+    """
+
+    _shared = None
+
+    # 超过该长度的文本以SHA-1摘要作为缓存键，避免缓存持有长文本
+    KEY_HASH_THRESHOLD = 256
+
+    @classmethod
+    def shared(cls):
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def __init__(self, max_entries=200000):
+        self.max_entries = max_entries
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text):
+        if len(text) <= self.KEY_HASH_THRESHOLD:
+            return text
+        return hashlib.sha1(text.encode('utf-8')).digest()
+
+    def _store(self, key, count):
+        with self._lock:
+            self._counts[key] = count
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+
+    def count(self, text):
+        if not text:
+            return 0
+        key = self._key(text)
+        count = self._counts.get(key)
+        if count is not None:
+            self.hits += 1
+            return count
+        self.misses += 1
+        count = len(get_encoder().encode(text, disallowed_special=()))
+        self._store(key, count)
+        return count
+
+    def count_prompt(self, prompt):
+        """按行累加的提示词令牌数估计（每个换行计一个令牌），用于限流和费用估算"""
+        lines = prompt.split("\n")
+        return sum(self.count(line) for line in lines) + len(lines) - 1
+
+    def encode_batch(self, texts, num_threads=8):
+        """在线程池中批量编码尚未缓存的文本并缓存其令牌数"""
+        missing = list({text for text in texts if text and self._key(text) not in self._counts})
+        if not missing:
+            return
+        encoded = get_encoder().encode_batch(missing, num_threads=num_threads, disallowed_special=())
+        for text, tokens in zip(missing, encoded):
+            self._store(self._key(text), len(tokens))
+
+    async def precount(self, texts, num_threads=8):
+        await asyncio.to_thread(self.encode_batch, list(texts), num_threads)
+
+    def split_text(self, text, max_tokens):
+        """
+        把超过 max_tokens 的文本拆成若干块，优先在句末断开
+        单个句子仍然超长时按令牌硬切分
+        """
+        if self.count(text) <= max_tokens:
+            return [text]
+        encoder = get_encoder()
+        chunks = []
+        current, current_tokens = "", 0
+        for sentence in (s for s in SENTENCE_END.split(text) if s):
+            tokens = len(encoder.encode(sentence, disallowed_special=()))
+            if tokens > max_tokens:
+                if current:
+                    chunks.append(current)
+                    current, current_tokens = "", 0
+                encoded = encoder.encode(sentence, disallowed_special=())
+                chunks.extend(self._hard_split(encoder, encoded, max_tokens))
+                continue
+            # 各句令牌数之和作为块长度的估计，不缓存中间结果
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append(current)
+                current, current_tokens = sentence, tokens
+            else:
+                current += sentence
+                current_tokens += tokens
+        if current:
+            chunks.append(current)
+        return chunks
+
+    @staticmethod
+    def _hard_split(encoder, encoded, max_tokens):
+        """
+        按令牌硬切分，切分点退回到解码后文本的字符边界：一个汉字可能由多个令牌组成，
+        直接按令牌区间解码会在块的首尾产生替换字符。每块不超过 max_tokens 个令牌
+        """
+        decoded, offsets = encoder.decode_with_offsets(encoded)
+        chunks = []
+        start = 0
+        while start < len(encoded):
+            end = start + max_tokens
+            if end >= len(encoded):
+                chunks.append(decoded[offsets[start]:])
+                break
+            # offsets 非递减，跨字符的令牌与该字符的首个令牌偏移相同，下一块从该字符开始
+            cut = bisect.bisect_left(offsets, offsets[end], start)
+            if cut == start:
+                # 单个字符的令牌数超过上限，只能整字符放入一块
+                cut = bisect.bisect_right(offsets, offsets[start], start)
+            chunks.append(decoded[offsets[start]:offsets[cut] if cut < len(encoded) else len(decoded)])
+            start = cut
+        return chunks
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._counts),
+            "hit_rate": round(self.hits / total, 3) if total else None
+        }
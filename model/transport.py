@@ -0,0 +1,141 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import zlib
+from collections import defaultdict
+
+import aiohttp
+
+from .retry import ProviderError
+
+
+class CassetteMiss(Exception):
+    """回放模式下磁带中没有对应请求的记录"""
+
+
+class Cassette:
+    """
+    模型请求的录制/回放层，位于 BaseModel 的HTTP请求之下
+    - record：把每次请求的结果（输出文本、usage、状态码、耗时）逐行写入磁带文件
+    - replay：不访问网络，按请求内容从磁带中取回结果，可按录制时的耗时实时回放或零延迟回放
+    - passthrough：直接访问网络，不录制
+    磁带以请求体（模型、消息、response_format）的哈希为键，不保存提示词原文；路径以 .gz 结尾时使用gzip压缩，
+    每条记录写为一个完整的gzip成员并立即刷新，录制进程崩溃时已写入的记录仍可回放
+    同一请求的多条记录按顺序回放，录制时的错误和重试过程因此可以原样重现
+    录制时磁带文件已存在则报错，overwrite 为True时才覆盖
+    """
+
+    MODES = ("record", "replay", "passthrough")
+
+    def __init__(self, path, mode="passthrough", realtime=False, overwrite=False):
+        if mode not in self.MODES:
+            raise ValueError(f"未知的磁带模式: {mode}")
+        if mode == "record" and not overwrite and os.path.exists(path):
+            raise FileExistsError(f"磁带文件已存在: {path}，如需重新录制请删除该文件或设置 overwrite")
+        self.path = path
+        self.mode = mode
+        # 回放时是否按录制的耗时等待
+        self.realtime = realtime
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self._file = None
+        self._entries = defaultdict(list)
+        self._positions = defaultdict(int)
+        if mode == "replay":
+            self._load()
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    @property
+    def recording(self):
+        return self.mode == "record"
+
+    @property
+    def compressed(self):
+        return self.path.endswith(".gz")
+
+    def _load(self):
+        try:
+            if self.compressed:
+                f = gzip.open(self.path, "rt", encoding='utf-8')
+            else:
+                f = open(self.path, 'r', encoding='utf-8')
+            with f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 录制进程崩溃时最后一行可能不完整
+                        continue
+                    self._entries[entry["key"]].append(entry)
+        except (EOFError, gzip.BadGzipFile, zlib.error):
+            # 最后一个gzip成员写到一半，保留已读取的记录
+            pass
+
+    @staticmethod
+    def request_key(data):
+        """请求体的哈希，忽略 stream 和 stream_options 参数，流式和非流式录制的磁带可以互相回放"""
+        payload = {key: value for key, value in data.items() if key not in ("stream", "stream_options")}
+        return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+
+    def _write(self, entry):
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, 'wb')
+        data = (json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+        # 压缩磁带每条记录一个gzip成员，多个成员连接起来仍是合法的gzip文件
+        self._file.write(gzip.compress(data) if self.compressed else data)
+        self._file.flush()
+        self.recorded += 1
+
+    def record(self, data, content, usage, elapsed):
+        self._write({"key": self.request_key(data), "elapsed": round(elapsed, 4), "content": content, "usage": usage})
+
+    def record_error(self, data, error, elapsed):
+        """录制失败的请求：服务商错误保存状态码和 Retry-After，网络错误保存错误类别"""
+        entry = {"key": self.request_key(data), "elapsed": round(elapsed, 4), "error": str(error)}
+        if isinstance(error, ProviderError):
+            entry.update(status=error.status, retry_after=error.retry_after)
+        elif isinstance(error, asyncio.TimeoutError):
+            entry["status"] = "timeout"
+        else:
+            entry["status"] = "connection_error"
+        self._write(entry)
+
+    async def replay(self, data):
+        """返回 (输出文本, usage)，录制的是错误时抛出同类异常"""
+        key = self.request_key(data)
+        entries = self._entries.get(key)
+        if not entries:
+            self.misses += 1
+            raise CassetteMiss(f"磁带 {self.path} 中没有该请求的记录: {key}")
+        position = self._positions[key]
+        # 同一请求被调用的次数多于录制次数时，重复最后一条记录
+        entry = entries[min(position, len(entries) - 1)]
+        self._positions[key] = position + 1
+        self.replayed += 1
+        if self.realtime:
+            await asyncio.sleep(entry.get("elapsed", 0))
+        if "error" not in entry:
+            return entry["content"], entry.get("usage") or {}
+        status = entry.get("status")
+        if status == "timeout":
+            raise asyncio.TimeoutError(entry["error"])
+        if status == "connection_error":
+            raise aiohttp.ClientConnectionError(entry["error"])
+        raise ProviderError(entry["error"], status=status, retry_after=entry.get("retry_after"))
+
+    def stats(self):
+        return {"mode": self.mode, "recorded": self.recorded, "replayed": self.replayed, "misses": self.misses}
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
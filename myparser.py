@@ -1,12 +1,283 @@
 import re
 import json
 from log import Logger
+from metrics import metrics
+from tracing import tracer
 import asyncio
 
+# 单项评分结果的JSON Schema
+RESULT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "number"},
+        "explanation": {"type": "string"}
+    },
+    "required": ["score", "explanation"],
+    "additionalProperties": False
+}
+
+# 评估响应的JSON Schema，用于请求服务商的结构化输出
+EVALUATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "reasoning": {"type": "string"},
+        "result": RESULT_SCHEMA
+    },
+    "required": ["reasoning", "result"],
+    "additionalProperties": False
+}
+
+
+def multi_score_schema(criteria):
+    """合并评估模式的JSON Schema，result 中每个评分标准对应一个单项评分结果"""
+    return {
+        "type": "object",
+        "properties": {
+            "reasoning": {"type": "string"},
+            "result": {
+                "type": "object",
+                "properties": {criterion: RESULT_SCHEMA for criterion in criteria},
+                "required": list(criteria),
+                "additionalProperties": False
+            }
+        },
+        "required": ["reasoning", "result"],
+        "additionalProperties": False
+    }
+
+
+_SCHEMA_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool
+}
+
+
+def validate_schema(data, schema) -> bool:
+    """按JSON Schema的子集（type、properties、required）校验数据"""
+    expected = _SCHEMA_TYPES.get(schema.get("type"))
+    if expected is not None:
+        if not isinstance(data, expected) or (isinstance(data, bool) and schema.get("type") != "boolean"):
+            return False
+    if isinstance(data, dict):
+        if any(key not in data for key in schema.get("required", [])):
+            return False
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in data and not validate_schema(data[key], sub_schema):
+                return False
+    return True
+
+
+class IncrementalResultScanner:
+    """
+    流式响应的增量扫描器
+    逐块接收模型输出，按词法跟踪字符串和括号层级，一旦顶层对象中的 "result" 对象闭合即认为结果完整，
+    调用方可以立即停止读取剩余的流
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.start = None
+        self.end = None
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_chars = []
+        self._last_string = None
+        self._pending_key = None
+        self._result_depth = None
+
+    @property
+    def complete(self):
+        return self.end is not None
+
+    def feed(self, chunk: str) -> bool:
+        """追加一块输出，结果对象已闭合时返回True"""
+        offset = len(self.text)
+        self.text += chunk
+        if self.complete:
+            return True
+        for i, char in enumerate(chunk, offset):
+            if self._scan(i, char):
+                self.end = i
+                return True
+        return False
+
+    def _scan(self, index, char):
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == '\\':
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                self._last_string = "".join(self._string_chars)
+            else:
+                self._string_chars.append(char)
+            return False
+
+        if self.start is None:
+            # 跳过 ```json 代码块标记等对象之前的内容
+            if char == '{':
+                self.start = index
+                self._stack.append(char)
+            return False
+
+        if char == '"':
+            self._in_string = True
+            self._string_chars = []
+        elif char == ':' and len(self._stack) == 1:
+            self._pending_key = self._last_string
+        elif char == ',' and len(self._stack) == 1:
+            self._pending_key = None
+        elif char in '{[':
+            if char == '{' and len(self._stack) == 1 and self._pending_key == "result":
+                self._result_depth = 2
+            self._stack.append(char)
+        elif char in '}]':
+            if self._stack:
+                self._stack.pop()
+            if self._result_depth is not None and len(self._stack) == self._result_depth - 1:
+                return True
+            if not self._stack:
+                # 没有 result 包装的顶层对象闭合
+                return True
+        return False
+
+    def completed_text(self) -> str:
+        """返回到结果对象闭合为止的文本，并补全仍未闭合的外层括号，使其成为合法JSON"""
+        if not self.complete:
+            return self.text
+        closing = "".join('}' if char == '{' else ']' for char in reversed(self._stack))
+        return self.text[self.start:self.end + 1] + closing
+
+
+def balanced_objects(text: str):
+    """
+    按括号配对（忽略字符串内的括号）依次返回文本中所有顶层的 {...} 片段
+    只有ASCII双引号是字符串定界符：值中的中文引号是普通字符，整段使用全角引号的JSON由规范化阶段转换后再提取
+    """
+    depth = 0
+    start = None
+    in_string = False
+    escape = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char == '{':
+            if depth == 0:
+                start = i
+            depth += 1
+        elif char == '}' and depth > 0:
+            depth -= 1
+            if depth == 0:
+                yield text[start:i + 1]
+
+
+def normalize_json_text(text: str) -> str:
+    """修复常见的近似JSON：全角引号和标点、集合形式的reasoning、多余的尾随逗号"""
+    if '"' not in text:
+        # 整段使用全角引号作为JSON语法
+        text = text.replace('“', '"').replace('”', '"')
+    # 键后的全角冒号、字段之间的全角逗号
+    text = re.sub(r'"\s*：\s*', '": ', text)
+    text = re.sub(r'(["\d\]}])\s*，\s*"', r'\1, "', text)
+    # {"reasoning":{"..."}} 这种集合形式改为字符串
+    text = re.sub(r'("reasoning"\s*:\s*)\{\s*("(?:[^"\\]|\\.)*")\s*\}', r'\1\2', text)
+    # 尾随逗号
+    text = re.sub(r',\s*([}\]])', r'\1', text)
+    return text
+
+
+SCORE_KEYS = ("score", "评分", "分数", "得分")
+EXPLANATION_KEYS = ("explanation", "解释", "理由", "说明", "原因")
+
+
+def find_score_fields(data):
+    """在（可能嵌套的）字典中查找评分和解释字段，键名大小写和中英文均可"""
+    if isinstance(data, dict):
+        lowered = {str(key).strip().lower(): value for key, value in data.items()}
+        score = next((lowered[key] for key in SCORE_KEYS if key in lowered), None)
+        explanation = next((lowered[key] for key in EXPLANATION_KEYS if key in lowered), None)
+        if score is not None and not isinstance(score, (dict, list)):
+            return score, explanation
+        # 优先查找 result，再查找其他嵌套对象
+        nested = [lowered["result"]] if "result" in lowered else []
+        nested += [value for value in data.values() if isinstance(value, (dict, list))]
+        for value in nested:
+            found = find_score_fields(value)
+            if found:
+                return found
+    elif isinstance(data, list):
+        for value in data:
+            found = find_score_fields(value)
+            if found:
+                return found
+    return None
+
+
+SCORE_PATTERN = re.compile(r'(?:score|评分|分数|得分)["\'”\s]*[:：=]\s*["\'“]?\s*([1-5](?:\.\d+)?)', re.IGNORECASE)
+RESULT_KEY_PATTERN = re.compile(r'["“]result["”]\s*[:：]', re.IGNORECASE)
+EXPLANATION_PATTERN = re.compile(r'(?:explanation|解释|理由|说明|原因)["\'”\s]*[:：]\s*["\'“]?(.+?)["\'”]?\s*(?:[,，]\s*["\'“]?\w+["\'”]?\s*[:：]|[}\n]|$)', re.IGNORECASE)
+
+
 class ResponseParser:
     def __init__(self, logger, model):
         self.logger = logger
         self.model = model
+        # 各解析路径的命中次数，用于统计回退比例
+        self.stats = {
+            "fast": 0,
+            "fenced": 0,
+            "repair_braces": 0,
+            "repair_normalized": 0,
+            "repair_regex": 0,
+            "ai_assisted": 0,
+            "failed": 0,
+            "no_response": 0
+        }
+
+    def fast_parse(self, response: str, schema=RESULT_SCHEMA):
+        """
+        快速路径：响应本身就是合法JSON（结构化输出）时直接按Schema校验，
+        通过时返回结果对象，否则返回None
+        """
+        try:
+            response_dict = json.loads(response)
+        except (json.JSONDecodeError, TypeError):
+            return None
+        result = response_dict.get('result', response_dict) if isinstance(response_dict, dict) else None
+        if result is None or not validate_schema(result, schema):
+            return None
+        return result
+
+    def _record(self, outcome: str):
+        self.stats[outcome] += 1
+        metrics.inc("parse_outcomes_total", outcome=outcome)
+
+    def fallback_rate(self) -> float:
+        """未能通过快速路径解析的响应比例"""
+        total = sum(self.stats.values()) - self.stats["no_response"]
+        return round(1 - self.stats["fast"] / total, 3) if total else 0.0
+
+    def ai_fallback_rate(self) -> float:
+        """本地解析和修复全部失败、需要再次调用模型的响应比例"""
+        total = sum(self.stats.values()) - self.stats["no_response"]
+        return round((self.stats["ai_assisted"] + self.stats["failed"]) / total, 3) if total else 0.0
+
+    def stats_summary(self) -> dict:
+        return {**self.stats, "fallback_rate": self.fallback_rate(), "ai_fallback_rate": self.ai_fallback_rate()}
 
     def extract_json_from_markdown(self, markdown_string):
         pattern = r'```json\s*(.*?)\s*```'
@@ -24,7 +295,74 @@ class ResponseParser:
             self.logger.error("未找到JSON代码段")
             return None
 
+    @staticmethod
+    def _valid_score(score, explanation):
+        try:
+            score = float(score)
+        except (TypeError, ValueError):
+            return None
+        if not (1 <= score <= 5) or explanation is None:
+            return None
+        return score, str(explanation)
+
+    def _repair_load(self, response: str):
+        """
+        本地修复的前两级：平衡括号提取，以及规范化后再提取
+        返回 (修复级别, 解析出的对象) 或 None
+        """
+        for stage, text in (("repair_braces", response), ("repair_normalized", normalize_json_text(response))):
+            for candidate in sorted(balanced_objects(text), key=len, reverse=True):
+                try:
+                    return stage, json.loads(candidate)
+                except json.JSONDecodeError:
+                    continue
+        return None
+
+    def local_repair(self, response: str):
+        """
+        在AI辅助解析之前依次尝试本地修复：
+        平衡括号提取 -> 引号和标点规范化 -> 宽松键名查找 -> 正则提取评分和解释
+        成功时返回 (分数, 解释)，全部失败时返回None
+        """
+        loaded = self._repair_load(response)
+        if loaded is not None:
+            stage, data = loaded
+            found = find_score_fields(data)
+            result = self._valid_score(*found) if found else None
+            if result is not None:
+                self._record(stage)
+                Logger.log_parsing_result(self.logger, *result)
+                return result
+
+        # 只在 "result" 键之后查找，reasoning 中提到的"评分：N"不会被当作结果；没有 result 键时取最后一处
+        result_match = RESULT_KEY_PATTERN.search(response)
+        text = response[result_match.end():] if result_match else response
+        score_match = None
+        for score_match in SCORE_PATTERN.finditer(text):
+            pass
+        if score_match:
+            explanation_match = EXPLANATION_PATTERN.search(text)
+            explanation = explanation_match.group(1).strip() if explanation_match else text[score_match.end():].strip(' "”}\n，,')[:200]
+            result = self._valid_score(score_match.group(1), explanation)
+            if result is not None:
+                self._record("repair_regex")
+                Logger.log_parsing_result(self.logger, *result)
+                return result
+        return None
+
     async def parse_model_response(self, response: str) -> tuple:
+        if response is None:
+            # 模型调用在重试后仍然失败，没有可解析的内容，也不再进行AI辅助解析
+            Logger.log_warning(self.logger, "模型未返回响应，该项评分记为None")
+            self._record("no_response")
+            return None, None
+
+        result = self.fast_parse(response)
+        if result is not None and 1 <= float(result['score']) <= 5:
+            self._record("fast")
+            Logger.log_parsing_result(self.logger, float(result['score']), result['explanation'])
+            return float(result['score']), result['explanation']
+
         try:
             # 首先尝试从可能的Markdown响应中提取JSON
             extracted_json = self.extract_json_from_markdown(response)
@@ -53,16 +391,66 @@ class ResponseParser:
                     score = None
 
             if score is not None and explanation is not None:
+                self._record("fenced")
                 Logger.log_parsing_result(self.logger, score, explanation)
                 return score, explanation
             else:
                 raise ValueError("Missing score or explanation in the response")
 
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
+        except (json.JSONDecodeError, KeyError, ValueError, TypeError, AttributeError) as e:
             Logger.log_parsing_error(self.logger, str(e), response)
+            repaired = self.local_repair(response)
+            if repaired is not None:
+                return repaired
             self.logger.info("Attempting AI-assisted parsing...")
             return await self.ai_assisted_parsing(response)
 
+    def parse_multi_score_response(self, response: str, criteria: list) -> dict:
+        """
+        解析合并评估模式的响应，返回 评分标准 -> (分数, 解释) 的字典
+        无法解析或分数无效的标准不会出现在结果中，由调用方单独重新评估
+        """
+        results = {}
+        if response is None:
+            self._record("no_response")
+            return results
+        try:
+            result = self.fast_parse(response, multi_score_schema(criteria)["properties"]["result"])
+            if result is not None:
+                outcome = "fast"
+            else:
+                extracted_json = self.extract_json_from_markdown(response)
+                if extracted_json:
+                    outcome = "fenced"
+                    response_dict = extracted_json
+                else:
+                    loaded = self._repair_load(response)
+                    if loaded is None:
+                        raise ValueError("No JSON object found in the response")
+                    outcome, response_dict = loaded
+                result = response_dict.get('result', response_dict)
+            if not isinstance(result, dict):
+                raise ValueError("The result in the response is not an object")
+        except (json.JSONDecodeError, AttributeError, TypeError, ValueError) as e:
+            Logger.log_parsing_error(self.logger, str(e), response)
+            self._record("failed")
+            return results
+
+        # 每个标准单独校验，某一项评分无效时只跳过该项
+        for criterion in criteria:
+            item = result.get(criterion)
+            if not isinstance(item, dict):
+                continue
+            valid = self._valid_score(item.get('score'), item.get('explanation'))
+            if valid is None:
+                Logger.log_warning(self.logger, f"Invalid score {item.get('score')!r} for {criterion}")
+                continue
+            Logger.log_parsing_result(self.logger, *valid)
+            results[criterion] = valid
+        # 至少有一项评分通过校验才计入对应的解析路径
+        self._record(outcome if results else "failed")
+        return results
+
     async def ai_assisted_parsing(self, response: str) -> tuple:
         prompt = f"""
         以下是一个AI模型的响应，但其JSON格式可能不正确。请从中提取评分（1-5的数字）和解释。
@@ -75,7 +463,8 @@ class ResponseParser:
         {{"score": 提取的评分, "explanation": "提取的解释"}}
         """
 
-        parsing_response = await self.model.get_response(prompt)
+        with metrics.timer("ai_assisted_parse_seconds"), tracer.span("ai_assisted_parse"):
+            parsing_response = await self.model.get_response(prompt, response_schema=RESULT_SCHEMA)
         
         try:
             # 首先尝试从可能的Markdown响应中提取JSON
@@ -97,13 +486,15 @@ class ResponseParser:
                     score = None
             
             if score is not None and explanation is not None:
+                self._record("ai_assisted")
                 Logger.log_ai_assisted_parsing(self.logger, score, explanation)
                 return score, explanation
             else:
                 raise ValueError("Missing score or explanation in the AI-assisted parsing response")
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
+        except (json.JSONDecodeError, KeyError, ValueError, TypeError, AttributeError) as e:
+            self._record("failed")
             Logger.log_parsing_error(self.logger, str(e), parsing_response)
-            return 0, None
+            return None, None
 
 if __name__ == "__main__":
     # 示例使用
@@ -120,7 +511,7 @@ if __name__ == "__main__":
         def info(msg): print(f"INFO: {msg}")
 
     class SimpleModel:
-        async def get_response(self, prompt):
+        async def get_response(self, prompt, response_schema=None):
             return '{"score": 3, "explanation": "这是一个模拟的AI辅助解析结果"}'
 
     # 创建 ResponseParser 实例
@@ -0,0 +1,118 @@
+import asyncio
+from collections import deque
+
+
+class EvaluationUnit:
+    """任务图中的一个评估单元"""
+
+    def __init__(self, unit_id, run, deps=(), uses_capacity=True):
+        self.unit_id = unit_id
+        # run: 无参数的协程函数
+        self.run = run
+        self.deps = list(deps)
+        # 汇总类单元不调用模型，不占用并发容量
+        self.uses_capacity = uses_capacity
+
+
+class TaskGraphScheduler:
+    """
+    基于依赖关系的异步调度器
+    任何依赖已完成的单元在有空闲容量时立即执行，不受添加顺序的限制
+    调用 open() 后可以在运行期间继续添加单元，直到 close() 为止
+    """
+
+    def __init__(self, max_concurrency=10):
+        self.max_concurrency = max_concurrency
+        self.units = {}
+        self.results = {}
+        self._waiting_deps = {}
+        self._dependents = {}
+        self._ready = deque()
+        self._accepting = False
+        self._wakeup = None
+
+    def add(self, unit_id, run, deps=(), uses_capacity=True):
+        if unit_id in self.units:
+            raise ValueError(f"重复的评估单元: {unit_id}")
+        unit = EvaluationUnit(unit_id, run, deps, uses_capacity)
+        self.units[unit_id] = unit
+        pending = [dep for dep in unit.deps if dep not in self.results]
+        self._waiting_deps[unit_id] = len(pending)
+        for dep in pending:
+            self._dependents.setdefault(dep, []).append(unit_id)
+        if not pending:
+            self._ready.append(unit_id)
+            self._notify()
+        return unit
+
+    def open(self):
+        """允许在 run() 执行期间添加单元"""
+        self._accepting = True
+
+    def close(self):
+        """不再添加新单元，run() 在现有单元全部完成后返回"""
+        self._accepting = False
+        self._notify()
+
+    def _notify(self):
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    def set_result(self, unit_id, result):
+        """直接写入已知结果（例如从检查点恢复的单元）"""
+        self.results[unit_id] = result
+
+    def count(self, uses_capacity=True):
+        return sum(1 for unit in self.units.values() if unit.uses_capacity == uses_capacity)
+
+    def _resolve(self, unit_id):
+        for dependent in self._dependents.pop(unit_id, []):
+            self._waiting_deps[dependent] -= 1
+            if self._waiting_deps[dependent] == 0:
+                self._ready.append(dependent)
+
+    async def run(self, on_unit_done=None):
+        """执行所有单元，返回 unit_id -> 结果 的字典"""
+        running = {}
+        in_flight = 0
+
+        while self._ready or running or self._accepting:
+            # 启动所有就绪且有容量的单元
+            deferred = deque()
+            while self._ready:
+                unit = self.units[self._ready.popleft()]
+                if unit.uses_capacity and in_flight >= self.max_concurrency:
+                    deferred.append(unit.unit_id)
+                    continue
+                if unit.uses_capacity:
+                    in_flight += 1
+                running[asyncio.ensure_future(unit.run())] = unit
+            self._ready = deferred
+
+            if not running and not self._accepting:
+                break
+
+            # 等待任一单元完成，或者有新的单元加入
+            self._wakeup = asyncio.get_running_loop().create_future()
+            done, _ = await asyncio.wait([*running, self._wakeup], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is self._wakeup:
+                    continue
+                unit = running.pop(task)
+                if unit.uses_capacity:
+                    in_flight -= 1
+                try:
+                    self.results[unit.unit_id] = task.result()
+                except BaseException:
+                    for pending_task in running:
+                        pending_task.cancel()
+                    self._wakeup.cancel()
+                    raise
+                self._resolve(unit.unit_id)
+                if on_unit_done:
+                    on_unit_done(unit)
+
+        unfinished = [unit_id for unit_id in self.units if unit_id not in self.results]
+        if unfinished:
+            raise RuntimeError(f"存在无法满足依赖的评估单元: {unfinished[:5]}")
+        return self.results
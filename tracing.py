@@ -0,0 +1,121 @@
+import asyncio
+import contextvars
+import heapq
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# 当前上下文的追踪属性（文档、章节、评分标准），随 asyncio 任务传递
+_trace_attrs = contextvars.ContextVar('trace_attrs', default={})
+
+
+@contextmanager
+def trace_attrs(**attrs):
+    """在上下文中附加追踪属性，期间记录的所有区间都带上这些属性"""
+    token = _trace_attrs.set({**_trace_attrs.get(), **attrs})
+    try:
+        yield
+    finally:
+        _trace_attrs.reset(token)
+
+
+class Tracer:
+    """
+    可选的时间线追踪：记录每次调用各阶段的区间，输出 Chrome Trace / Perfetto 可读取的JSON
+    每个 asyncio 任务对应时间线上的一条轨道，并发的评估单元互不重叠；任务结束后轨道由新任务复用
+    未启用时 span() 返回空的上下文管理器，几乎没有开销
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.max_events = 1000000
+        self.events = []
+        self.dropped = 0
+        self._tracks = {}
+        self._free_tracks = []
+        self._next_track = 1
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def enable(self, max_events=1000000):
+        self.enabled = True
+        self.max_events = max_events
+        self._start = time.monotonic()
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return nullcontext()
+        return self._span(name, args)
+
+    def record(self, name, start, **args):
+        """记录从 start（time.monotonic() 的读数）到现在的区间，用于无法包在 with 块中的阶段"""
+        if self.enabled:
+            self._add(name, start, time.monotonic(), args)
+
+    @contextmanager
+    def _span(self, name, args):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._add(name, start, time.monotonic(), args)
+
+    def _track(self):
+        """
+        当前任务（或线程）所在的轨道编号，调用方持有 self._lock
+        任务结束后其轨道编号回收给后续任务复用，轨道数量不超过同时存在的任务数
+        """
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = id(task) if task is not None else ("thread", threading.get_ident())
+        track = self._tracks.get(key)
+        if track is None:
+            if self._free_tracks:
+                track = heapq.heappop(self._free_tracks)
+            else:
+                track = self._next_track
+                self._next_track += 1
+                name = f"asyncio 任务 {track}" if task is not None else threading.current_thread().name
+                self.events.append({"ph": "M", "name": "thread_name", "pid": os.getpid(), "tid": track, "args": {"name": name}})
+            self._tracks[key] = track
+            if task is not None:
+                task.add_done_callback(self._release_track)
+        return track
+
+    def _release_track(self, task):
+        with self._lock:
+            track = self._tracks.pop(id(task), None)
+            if track is not None:
+                heapq.heappush(self._free_tracks, track)
+
+    def _add(self, name, start, end, args):
+        with self._lock:
+            if len(self.events) >= self.max_events:
+                self.dropped += 1
+                return
+            self.events.append({
+                "name": name,
+                "ph": "X",
+                "ts": round((start - self._start) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": self._track(),
+                "args": {**_trace_attrs.get(), **args}
+            })
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms",
+                       "otherData": {"dropped_events": self.dropped}}, f, ensure_ascii=False)
+        print(f"追踪文件已保存到: {path}（可在 chrome://tracing 或 ui.perfetto.dev 中打开）")
+
+
+# 进程内共享的追踪器
+tracer = Tracer()
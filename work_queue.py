@@ -0,0 +1,129 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+
+class QueueItem:
+    """工作队列中的一个数据集项目及其进度"""
+
+    def __init__(self, item_key, weight=1.0, priority=0, deadline=None):
+        self.item_key = item_key
+        self.weight = weight
+        self.priority = priority
+        # 截止时间（时间戳），优先级相同时截止时间早的项目先执行
+        self.deadline = deadline
+        # 加权公平队列的虚拟时间：已获得的服务量 / 权重
+        self.virtual_time = 0.0
+        self.waiters = deque()
+        self.total = 0
+        self.done = 0
+        self.started = None
+
+    def eta(self):
+        """按该项目已完成单元的平均速度估算剩余秒数"""
+        if not self.done or self.started is None:
+            return None
+        elapsed = time.monotonic() - self.started
+        return elapsed / self.done * max(0, self.total - self.done)
+
+
+class WorkQueue:
+    """
+    整次运行共用的跨文档工作队列
+    所有项目的模型调用在同一个并发预算内调度：先按优先级，再按截止时间，最后按加权公平队列的虚拟时间，
+    避免单个大文档占满服务商容量而让小项目长时间等待
+    """
+
+    def __init__(self, max_concurrency=64, concurrency=None):
+        self.max_concurrency = max_concurrency
+        # 可选的自适应并发控制器：队列放行的请求数不超过其当前窗口，排队顺序由本队列决定
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.items = {}
+        self._virtual_clock = 0.0
+
+    @property
+    def limit(self):
+        if self.concurrency is None:
+            return self.max_concurrency
+        return min(self.max_concurrency, self.concurrency.window)
+
+    def register(self, item_key, weight=1.0, priority=0, deadline=None):
+        if isinstance(deadline, str):
+            deadline = datetime.fromisoformat(deadline).timestamp()
+        item = self.items[item_key] = QueueItem(item_key, weight, priority, deadline)
+        return item
+
+    def add_units(self, item_key, count):
+        self.items[item_key].total += count
+
+    def unit_done(self, item_key):
+        self.items[item_key].done += 1
+
+    @asynccontextmanager
+    async def slot(self, item_key):
+        """在全局并发预算内为某个项目执行一次模型调用"""
+        item = self.items[item_key]
+        if self.in_flight < self.limit and not any(other.waiters for other in self.items.values()):
+            self._dispatch_to(item)
+        else:
+            if not item.waiters:
+                # 项目重新进入排队时从当前虚拟时间开始计，空闲期间不积累额度
+                item.virtual_time = max(item.virtual_time, self._virtual_clock)
+            future = asyncio.get_running_loop().create_future()
+            item.waiters.append(future)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self.in_flight -= 1
+                    self._wake()
+                elif future in item.waiters:
+                    item.waiters.remove(future)
+                raise
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._wake()
+
+    def _dispatch_to(self, item):
+        self.in_flight += 1
+        if item.started is None:
+            item.started = time.monotonic()
+        self._virtual_clock = item.virtual_time
+        item.virtual_time += 1.0 / item.weight
+
+    def _next_item(self):
+        backlogged = [item for item in self.items.values() if item.waiters]
+        if not backlogged:
+            return None
+        return min(backlogged, key=lambda item: (
+            -item.priority,
+            item.deadline if item.deadline is not None else float('inf'),
+            item.virtual_time
+        ))
+
+    def _wake(self):
+        while self.in_flight < self.limit:
+            item = self._next_item()
+            if item is None:
+                break
+            future = item.waiters.popleft()
+            if future.done():
+                continue
+            self._dispatch_to(item)
+            future.set_result(None)
+
+    def progress(self):
+        """返回每个项目的进度：项目 -> (已完成, 总数, 预计剩余秒数)"""
+        return {key: (item.done, item.total, item.eta()) for key, item in self.items.items()}
+
+    def progress_summary(self):
+        lines = []
+        for key, (done, total, eta) in self.progress().items():
+            eta_text = f"{eta:.0f}秒" if eta is not None else "未知"
+            lines.append(f"{key}: {done}/{total}，预计剩余 {eta_text}")
+        return "\n".join(lines)